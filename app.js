@@ -3,10 +3,13 @@
 // =========================
 let detectionEnabled = true;
 let lastEmotion = "";
+let groqItems = [];
+let eventSource = null;
 let negativeMoodActive = false;
 
 let tasks = [];
 let emails = [];
+let emailsCursor = null;
 let currentTab = "inbox";
 let currentOpenEmailId = null;
 
@@ -51,6 +54,7 @@ async function apiUpdateTask(id,payload){ await fetch(`/api/tasks/${id}`,{method
 async function apiDeleteTask(id){ await fetch(`/api/tasks/${id}`,{method:"DELETE"}); }
 
 async function apiLoadEmails(params={}){ const q = new URLSearchParams(params).toString(); const r = await fetch(`/api/emails${q?`?${q}`:""}`); return await r.json(); }
+async function apiGetEmail(id){ const r = await fetch(`/api/emails/${id}`); return await r.json(); }
 async function apiSaveDraft(payload){ const r = await fetch("/api/emails/draft",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(payload)}); return await r.json(); }
 async function apiSendEmail(payload){ const r = await fetch("/api/emails/send",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(payload)}); return await r.json(); }
 async function apiPatchEmail(id,payload){ await fetch(`/api/emails/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(payload)}); }
@@ -59,10 +63,23 @@ async function apiDeleteEmail(id){ await fetch(`/api/emails/${id}`,{method:"DELE
 // =========================
 // Emails UI
 // =========================
-function setActiveTab(tab){
+// one page at a time, newest first; "Load more" follows next_cursor
+function emailQueryForTab(tab){ return tab === "starred" ? { starred: "1" } : { folder: tab }; }
+async function loadEmails(more=false){
+    const params = emailQueryForTab(currentTab);
+    if (more && emailsCursor) params.cursor = emailsCursor;
+    const page = await apiLoadEmails(params);
+    emails = more ? emails.concat(page.items) : page.items;
+    emailsCursor = page.next_cursor;
+    renderEmailList();
+}
+async function reloadEmails(){ await loadEmails(false); clearEmailView(); }
+async function setActiveTab(tab){
     currentTab = tab;
     document.querySelectorAll(".mail-tabs button").forEach(btn => btn.classList.toggle("active-tab", btn.dataset.tab === tab));
+    emails = []; emailsCursor = null;
     renderEmailList(); clearEmailView();
+    await loadEmails(false);
 }
 function getFilteredEmails(){
     if (currentTab === "starred") return emails.filter(e => !!e.starred);
@@ -90,9 +107,10 @@ function clearEmailView(){
     currentOpenEmailId = null;
     const rb = document.getElementById("replyBtn"); if (rb) rb.disabled = true;
 }
-function displayEmail(id){
+async function displayEmail(id){
     const email = emails.find(e => e.id === id); if(!email) return;
     markRead(id);
+    if (email.content === undefined) email.content = (await apiGetEmail(id)).content;
     document.getElementById("emailSender").textContent = email.sender || "";
     if (email.to){
         const receiverDiv = document.getElementById("emailReceiver");
@@ -141,7 +159,7 @@ function renderEmailList(){
         const sender = document.createElement("strong"); sender.textContent = email.sender;
         const subject = document.createElement("span"); subject.className = "subject"; subject.textContent = email.subject;
         senderSubject.appendChild(sender); senderSubject.appendChild(subject);
-        const preview = document.createElement("div"); preview.className = "preview"; preview.textContent = (email.content||"").split("\n")[0];
+        const preview = document.createElement("div"); preview.className = "preview"; preview.textContent = (email.preview||"").split("\n")[0];
         meta.appendChild(senderSubject); meta.appendChild(preview);
 
         const rightSide = document.createElement("div");
@@ -162,9 +180,7 @@ function renderEmailList(){
             delBtn.onclick = async (ev)=>{
                 ev.stopPropagation();
                 await apiDeleteEmail(email.id);
-                emails = await apiLoadEmails();
-                renderEmailList();
-                clearEmailView();
+                await reloadEmails();
                 showToast("Draft deleted");
             };
 
@@ -180,9 +196,7 @@ function renderEmailList(){
             delBtn.onclick = async (ev)=>{
                 ev.stopPropagation();
                 await apiDeleteEmail(email.id);
-                emails = await apiLoadEmails();
-                renderEmailList();
-                clearEmailView();
+                await reloadEmails();
                 showToast("Email deleted");
             };
             rightSide.appendChild(delBtn);
@@ -194,10 +208,18 @@ function renderEmailList(){
         item.appendChild(rightSide);
         group.appendChild(item);
     });
+    if (emailsCursor) {
+        const more = document.createElement("button");
+        more.className = "list-btn";
+        more.textContent = "Load more";
+        more.onclick = () => loadEmails(true);
+        group.appendChild(more);
+    }
     container.appendChild(group);
 }
 
-function startReply(email){
+async function startReply(email){
+    if (email.content === undefined) email.content = (await apiGetEmail(email.id)).content;
     const toAddr = extractEmailAddress(email.sender) || email.to || "";
     openCompose();
     document.getElementById("composeTo").value = toAddr;
@@ -224,9 +246,10 @@ function openCompose(){
     document.getElementById("composeBody").value = "";
     document.getElementById("composeTo").focus();
 }
-function openComposeWithDraft(id){
+async function openComposeWithDraft(id){
     const draft = emails.find(e => e.id === id && e.folder === "draft");
     if (!draft) return;
+    if (draft.content === undefined) draft.content = (await apiGetEmail(id)).content;
     currentEditingDraftId = id;
     const win = document.getElementById("composeWindow");
     win.classList.remove("minimized"); win.style.display = "block";
@@ -245,9 +268,7 @@ async function saveDraft(){
     const payload = { id: currentEditingDraftId, to, subject: subject || "(no subject)", content: body || "" };
     const out = await apiSaveDraft(payload);
     currentEditingDraftId = out.id;
-    emails = await apiLoadEmails();
-    setActiveTab("draft");
-    renderEmailList();
+    await setActiveTab("draft");
     showToast("Draft saved");
 }
 
@@ -259,9 +280,7 @@ async function sendEmail(){
     const payload = { id: currentEditingDraftId, to, subject: subject || "(no subject)", content: body || "(no content)" };
     await apiSendEmail(payload);
     currentEditingDraftId = null;
-    emails = await apiLoadEmails();
-    setActiveTab("sent");
-    renderEmailList();
+    await setActiveTab("sent");
     const justSent = emails.find(e => e.folder === "sent");
     if (justSent) displayEmail(justSent.id);
     showToast("Message sent");
@@ -439,82 +458,102 @@ function showSuggestionModal(emotion, activity){
 // Render status log with local time
 function fetchGroqResults(){
     if (!detectionEnabled) return;
-    fetch('/groq_results').then(res => res.json()).then(data => {
-        const list = document.getElementById("groqList");
-        const sidebar = document.querySelector(".sidebar");
-        const emailBox = document.querySelector(".email-box");
-        list.innerHTML = '';
-        if (!data.length) return;
-
-        const first = data[0];
-        let recentEmotionText = "";
-        if (typeof first === "string") {
-            recentEmotionText = first.toLowerCase();
-            data.forEach(item => { const li=document.createElement("li"); li.textContent=item; list.appendChild(li); });
-        } else {
-            recentEmotionText = (first.emotion || "").toLowerCase();
-            data.forEach(it => {
-                const timeStr = new Date(it.ts).toLocaleTimeString();
-                const li = document.createElement("li");
-                li.textContent = `[${timeStr}] ${it.emotion}`;
-                list.appendChild(li);
-            });
-        }
+    fetch('/groq_results').then(res => res.json()).then(data => { groqItems = data; applyGroqResults(data); });
+}
+function applyGroqResults(data){
+    const list = document.getElementById("groqList");
+    const sidebar = document.querySelector(".sidebar");
+    const emailBox = document.querySelector(".email-box");
+    list.innerHTML = '';
+    if (!data.length) return;
+
+    const first = data[0];
+    let recentEmotionText = "";
+    if (typeof first === "string") {
+        recentEmotionText = first.toLowerCase();
+        data.forEach(item => { const li=document.createElement("li"); li.textContent=item; list.appendChild(li); });
+    } else {
+        recentEmotionText = (first.emotion || "").toLowerCase();
+        data.forEach(it => {
+            const timeStr = new Date(it.ts).toLocaleTimeString();
+            const li = document.createElement("li");
+            li.textContent = `[${timeStr}] ${it.emotion}`;
+            list.appendChild(li);
+        });
+    }
 
-        lastEmotion = recentEmotionText;
-        const positive = ["happy", "calm", "focused"];
-        const negative = ["sad", "angry", "stressed", "anxious", "tired"];
-        const isPositive = positive.some(w => recentEmotionText.includes(w));
-        const isNegative = negative.some(w => recentEmotionText.includes(w));
-
-        if (isPositive) {
-            negativeMoodActive = false;
-            showAllOverride = false;
-            document.body.style.backgroundColor = "#ededed";
-            sidebar.style.backgroundColor = "#40126b";
-            document.querySelectorAll(".task").forEach(el => { el.style.backgroundColor = "rgba(255,255,255,0.08)"; el.style.color = "#ffffff"; });
-            emailBox.classList.remove("dimmed");
-            sidebar.classList.remove("hidden");
-        } else if (isNegative) {
-            negativeMoodActive = true;
-            document.body.style.backgroundColor = "#EAF2FF";
-            sidebar.style.backgroundColor = "#0F2A52";
-            sidebar.classList.remove("hidden");
-            emailBox.classList.add("dimmed");
-        } else {
-            negativeMoodActive = false;
-            showAllOverride = false;
-            document.body.style.backgroundColor = "#ffffff";
-            sidebar.style.backgroundColor = "#193868";
-            sidebar.classList.remove("hidden");
-            emailBox.classList.remove("dimmed");
-        }
+    lastEmotion = recentEmotionText;
+    const positive = ["happy", "calm", "focused"];
+    const negative = ["sad", "angry", "stressed", "anxious", "tired"];
+    const isPositive = positive.some(w => recentEmotionText.includes(w));
+    const isNegative = negative.some(w => recentEmotionText.includes(w));
 
-        renderTasks();
-    });
+    if (isPositive) {
+        negativeMoodActive = false;
+        showAllOverride = false;
+        document.body.style.backgroundColor = "#ededed";
+        sidebar.style.backgroundColor = "#40126b";
+        document.querySelectorAll(".task").forEach(el => { el.style.backgroundColor = "rgba(255,255,255,0.08)"; el.style.color = "#ffffff"; });
+        emailBox.classList.remove("dimmed");
+        sidebar.classList.remove("hidden");
+    } else if (isNegative) {
+        negativeMoodActive = true;
+        document.body.style.backgroundColor = "#EAF2FF";
+        sidebar.style.backgroundColor = "#0F2A52";
+        sidebar.classList.remove("hidden");
+        emailBox.classList.add("dimmed");
+    } else {
+        negativeMoodActive = false;
+        showAllOverride = false;
+        document.body.style.backgroundColor = "#ffffff";
+        sidebar.style.backgroundColor = "#193868";
+        sidebar.classList.remove("hidden");
+        emailBox.classList.remove("dimmed");
+    }
+
+    renderTasks();
 }
 
 function fetchSuggestion(){
     if (!detectionEnabled) return;
     fetch('/groq_suggestion')
         .then(res => res.json())
-        .then(data => {
-            const emotion = (data.emotion || "").toLowerCase();
-            const activity = data.activity || "";
-            const negativeEmotions = ["stressed", "angry", "sad", "tired", "anxious"];
-            if (!emotion || !negativeEmotions.includes(emotion) || !activity) return;
-
-            const key = `${emotion}|${activity}`;
-            const now = Date.now();
-            const cooledDown = (now - lastSuggestionAt) > SUGGESTION_COOLDOWN_MS;
-            if (key !== lastSuggestionKey || cooledDown) {
-                lastSuggestionKey = key;
-                lastSuggestionAt = now;
-                showSuggestionModal(data.emotion, activity);
-            }
-        })
+        .then(applySuggestion)
         .catch(err => console.error("Failed to fetch suggestion:", err));
 }
+function applySuggestion(data){
+    const emotion = (data.emotion || "").toLowerCase();
+    const activity = data.activity || "";
+    const negativeEmotions = ["stressed", "angry", "sad", "tired", "anxious"];
+    if (!emotion || !negativeEmotions.includes(emotion) || !activity) return;
+
+    const key = `${emotion}|${activity}`;
+    const now = Date.now();
+    const cooledDown = (now - lastSuggestionAt) > SUGGESTION_COOLDOWN_MS;
+    if (key !== lastSuggestionKey || cooledDown) {
+        lastSuggestionKey = key;
+        lastSuggestionAt = now;
+        showSuggestionModal(data.emotion, activity);
+    }
+}
+
+// Server push: labels/suggestions arrive as they are produced.
+// Polling only runs while the stream is unavailable.
+function startEventStream(){
+    if (!window.EventSource) return;
+    eventSource = new EventSource("/events");
+    eventSource.onopen = () => fetchGroqResults();   // resync after (re)connect
+    eventSource.addEventListener("label", ev => {
+        if (!detectionEnabled) return;
+        groqItems = [JSON.parse(ev.data)].concat(groqItems).slice(0, 10);
+        applyGroqResults(groqItems);
+    });
+    eventSource.addEventListener("suggestion", ev => {
+        if (!detectionEnabled) return;
+        applySuggestion(JSON.parse(ev.data));
+    });
+}
+function streamConnected(){ return !!eventSource && eventSource.readyState === EventSource.OPEN; }
 
 // =========================
 // Mood Journal + Summary
@@ -577,12 +616,62 @@ function drawBarChart(counts){
     values.forEach((v,i)=>{ const x=pad+i*(barW+gap); const h=Math.round((v/maxV)*(H-pad*2)); const y=H-pad-h; ctx.fillStyle="#1479FF"; ctx.fillRect(x,y,barW,h); ctx.fillStyle="#193868"; ctx.fillText(keys[i], x+barW/2, H-6); ctx.fillText(String(v), x+barW/2, y-4); });
 }
 
+// =========================
+// Browser camera (?camera=browser)
+// =========================
+// Capture here and upload small JPEG frames to /api/frames; the server
+// answers with the label only, so no video is streamed back.
+const INGEST_INTERVAL_MS = 500;
+const INGEST_WIDTH = 320;
+let ingestClientId = "";   // session id issued by the server on the first upload
+
+function setCamLabel(text){
+    const el = document.getElementById("localCamLabel");
+    if (el) el.textContent = text;
+}
+async function startBrowserCamera(){
+    const video = document.getElementById("localCam");
+    if (!video) return;
+    if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) { setCamLabel("Camera not available"); return; }
+    try {
+        video.srcObject = await navigator.mediaDevices.getUserMedia({ video: { width: 640, height: 480 }, audio: false });
+    } catch (e) {
+        setCamLabel("Camera permission denied");
+        return;
+    }
+    const canvas = document.createElement("canvas");
+    const tick = async () => {
+        let delay = INGEST_INTERVAL_MS;
+        if (detectionEnabled && video.videoWidth) {
+            canvas.width = INGEST_WIDTH;
+            canvas.height = Math.round(INGEST_WIDTH * video.videoHeight / video.videoWidth);
+            canvas.getContext("2d").drawImage(video, 0, 0, canvas.width, canvas.height);
+            const blob = await new Promise(resolve => canvas.toBlob(resolve, "image/jpeg", 0.7));
+            try {
+                const res = await fetch("/api/frames", {
+                    method: "POST",
+                    headers: { "Content-Type": "image/jpeg", "X-Client-Id": ingestClientId },
+                    body: blob
+                });
+                ingestClientId = res.headers.get("X-Client-Id") || ingestClientId;
+                const data = await res.json();
+                if (res.status === 429) delay = Math.max(delay, data.retry_after_ms || 1000);
+                else if (res.ok) setCamLabel(data.label);
+                else delay = 5000;
+            } catch (e) {
+                delay = 5000;
+            }
+        }
+        setTimeout(tick, delay);
+    };
+    tick();
+}
+
 // =========================
 // Init
 // =========================
 window.onload = async () => {
     tasks = await apiLoadTasks();
-    emails = await apiLoadEmails();
 
     document.querySelectorAll(".mail-tabs button").forEach(btn => btn.addEventListener("click", () => setActiveTab(btn.dataset.tab)));
     setActiveTab("inbox");
@@ -592,8 +681,10 @@ window.onload = async () => {
 
     fetchGroqResults();
     fetchSuggestion();
-    setInterval(fetchGroqResults, 3000);
-    setInterval(fetchSuggestion, 5000);
+    startEventStream();
+    startBrowserCamera();
+    setInterval(()=>{ if (!streamConnected()) fetchGroqResults(); }, 3000);
+    setInterval(()=>{ if (!streamConnected()) fetchSuggestion(); }, 5000);
 
     document.getElementById("suggestionClose").onclick = ()=> document.getElementById("suggestionModal").style.display="none";
 
@@ -1,5 +1,4 @@
 from flask import Flask, render_template, Response, jsonify, request, stream_with_context, has_app_context
-import cv2
 import base64
 import time
 import requests
@@ -7,10 +6,23 @@ import os
 import json
 import re
 import random
+import threading
+import queue
+import atexit
+import uuid
+import zlib
+import functools
+import bisect
+import csv
+import io
+from collections import deque, OrderedDict
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
-from deepface import DeepFace
 from datetime import datetime, timezone, timedelta
 from typing import Optional
+import click
+import importers
 
 #Load env 
 load_dotenv()
@@ -19,25 +31,163 @@ GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
 
 SUGGESTION_COOLDOWN_SECONDS = 60 
 
+# Groq call cadence and retry policy (exponential backoff with full jitter)
+GROQ_INTERVAL_SECONDS = 10
+GROQ_TIMEOUT_SECONDS = 20
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_BACKOFF_BASE = 0.5
+GROQ_BACKOFF_CAP = 8.0
+
+# Groq result cache: near-duplicate face crops (perceptual hash within
+# GROQ_CACHE_MAX_BITS, local scores within GROQ_CACHE_MAX_SCORE_DELTA points)
+# reuse the last label until it is GROQ_CACHE_MAX_AGE_SECONDS old; size 0 disables
+GROQ_CACHE_SIZE = int(os.getenv("GROQ_CACHE_SIZE", "64"))
+GROQ_CACHE_MAX_AGE_SECONDS = float(os.getenv("GROQ_CACHE_MAX_AGE_SECONDS", "120"))
+GROQ_CACHE_MAX_BITS = int(os.getenv("GROQ_CACHE_MAX_BITS", "8"))
+GROQ_CACHE_MAX_SCORE_DELTA = float(os.getenv("GROQ_CACHE_MAX_SCORE_DELTA", "15"))
+
+# Server-sent events: how many recent events are kept for Last-Event-ID resume,
+# and the keep-alive comment interval for idle streams
+EVENT_BACKLOG = 500
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Retention for mood_log/groq_label: rows older than MOOD_RETENTION_HOURS are
+# compacted to one dominant-emotion row per COMPACT_BUCKET_SECONDS (0 = keep
+# everything). Work runs in windows of COMPACT_BATCH_BUCKETS buckets, one short
+# transaction each, every COMPACT_EVERY_SECONDS.
+MOOD_RETENTION_HOURS = float(os.getenv("MOOD_RETENTION_HOURS", str(7 * 24)))
+COMPACT_BUCKET_SECONDS = int(os.getenv("COMPACT_BUCKET_SECONDS", "60"))
+COMPACT_BATCH_BUCKETS = 60
+COMPACT_EVERY_SECONDS = 300
+COMPACT_PAUSE_SECONDS = 0.05   # gap between windows so the camera writer gets the lock
+
+# Streaming export: rows fetched per round trip, rows per emitted chunk
+EXPORT_YIELD_PER = 1000
+EXPORT_FLUSH_ROWS = 200
+
+# Email list paging
+EMAIL_PAGE_DEFAULT = 50
+EMAIL_PAGE_MAX = 200
+EMAIL_PREVIEW_CHARS = 120
+
+# Mood-ranked inbox (?mood=): under these moods the calmest mail comes first
+# and mail at or above EMAIL_HIDE_URGENCY is left out; other moods get the
+# most urgent first
+EMAIL_CALM_MOODS = ("Stressed", "Angry", "Sad", "Tired", "Anxious")
+EMAIL_FOCUS_MOODS = ("Calm", "Happy", "Focused")
+EMAIL_HIDE_URGENCY = float(os.getenv("EMAIL_HIDE_URGENCY", "0.7"))
+EMAIL_SCORE_CHUNK = 500
+
+# Write-behind persistence for analysis rows: flush at this many pending rows or this often
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "50"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+
+# Local emotion inference cadence and smoothing
+EMOTION_INFER_INTERVAL = float(os.getenv("EMOTION_INFER_INTERVAL", "0.5"))  # seconds between passes
+EMOTION_MIN_INTERVAL = 0.1   # floor between passes even when the face moves
+EMOTION_BOX_SHIFT = 0.25     # centre shift / area change (fraction of box) that forces a pass
+EMOTION_EMA_ALPHA = float(os.getenv("EMOTION_EMA_ALPHA", "0.4"))
+
+# Emotion inference pool: worker processes (0 = one in-process thread),
+# micro-batch size and how long the first crop of a batch may wait
+EMOTION_WORKERS = int(os.getenv("EMOTION_WORKERS", "1"))
+EMOTION_BATCH_MAX = int(os.getenv("EMOTION_BATCH_MAX", "8"))
+EMOTION_BATCH_WAIT_MS = float(os.getenv("EMOTION_BATCH_WAIT_MS", "15"))
+
+# Face localization: full cascade detection on a downscaled frame every
+# FACE_DETECT_EVERY frames, template-match tracking in between
+FACE_DETECT_EVERY = int(os.getenv("FACE_DETECT_EVERY", "10"))
+FACE_DETECT_SCALE = float(os.getenv("FACE_DETECT_SCALE", "0.5"))
+FACE_TRACK_MIN_SCORE = 0.6   # match score below which tracking is lost and we re-detect
+FACE_MIN_FRACTION = 1 / 6     # smallest face searched for, as a share of the detection frame's short side
+
+# Frame ingestion (/api/frames): per-upload size cap, minimum gap between one
+# client's frames, idle time before its pipeline is dropped, and client limits
+# (overall and per remote address)
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(256 * 1024)))
+INGEST_MIN_INTERVAL_MS = float(os.getenv("INGEST_MIN_INTERVAL_MS", "100"))
+INGEST_IDLE_SECONDS = float(os.getenv("INGEST_IDLE_SECONDS", "120"))
+INGEST_MAX_CLIENTS = int(os.getenv("INGEST_MAX_CLIENTS", "32"))
+INGEST_MAX_CLIENTS_PER_ADDR = int(os.getenv("INGEST_MAX_CLIENTS_PER_ADDR", "4"))
+INGEST_INFER_WAIT_MS = float(os.getenv("INGEST_INFER_WAIT_MS", "300"))   # wait for this frame's scores before answering
+
+# Reverse proxies in front of the app that append X-Forwarded-For; with 0
+# request.remote_addr is the proxy, so every uploader shares one address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Stage latency histograms and error counters served on /metrics;
+# METRICS_ENABLED=0 registers nothing, so no stage is timed at all
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# "full": this process owns the camera and the vision pipeline (python app.py);
+# "api": headless worker for the page, status and /api routes, so several can
+# run side by side, e.g. gunicorn -w 4 "app:create_app('api')"
+APP_MODE = os.getenv("APP_MODE", "full")
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
+app.config["APP_MODE"] = APP_MODE
+if TRUSTED_PROXY_HOPS:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
 
 #  Database 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, insert, update, select, event, tuple_, text, or_, literal_column, inspect as sa_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects import sqlite as sqlite_dialect, postgresql as pg_dialect
+import sqlite3
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///emodash.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+# SQLite storage profile: WAL so the camera writer and UI readers don't block
+# each other, relaxed fsync (safe under WAL), bigger page cache and mmap reads
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),      # negative = KiB (~20 MB)
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+    "busy_timeout": "5000",
+}
+
+def _is_file_sqlite(uri):
+    return uri.startswith("sqlite:") and ":memory:" not in uri and uri.rstrip("/") != "sqlite:"
+
+if _is_file_sqlite(app.config["SQLALCHEMY_DATABASE_URI"]):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": QueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": 30,
+        "connect_args": {"check_same_thread": False, "timeout": 15},
+    }
+
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_pragmas(dbapi_conn, _record):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cur = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.close()
+
 db = SQLAlchemy(app)
 
 # Models 
 class MoodLog(db.Model):
     __tablename__ = "mood_log"
+    # time-window scans that only need the emotion column (summary/export)
+    __table_args__ = (db.Index("ix_mood_log_ts_emotion", "ts_utc", "emotion"),)
     id = db.Column(db.Integer, primary_key=True)
     ts_utc = db.Column(db.DateTime, nullable=False, index=True, default=lambda: datetime.utcnow())
     ts_iso = db.Column(db.String(40), nullable=False, default=lambda: datetime.now(timezone.utc).isoformat())
     emotion = db.Column(db.String(32), nullable=False, index=True)
     note = db.Column(db.String(255), nullable=False, default="")
     source = db.Column(db.String(16), nullable=False, default="auto")  
+    samples = db.Column(db.Integer, nullable=True, default=1)   # raw rows this row stands for (>1 once compacted)
 
 class GroqLabel(db.Model):
     __tablename__ = "groq_label"
@@ -63,6 +213,11 @@ class Task(db.Model):
 
 class EmailMessage(db.Model):
     __tablename__ = "email_message"
+    # folder/starred listings ordered by time
+    __table_args__ = (
+        db.Index("ix_email_message_folder_ts", "folder", "ts_utc"),
+        db.Index("ix_email_message_starred_ts", "starred", "ts_utc"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     sender = db.Column(db.String(255), nullable=False)   
     to = db.Column(db.String(255), nullable=True)
@@ -73,62 +228,651 @@ class EmailMessage(db.Model):
     read = db.Column(db.Boolean, nullable=False, default=False, index=True)
     date_str = db.Column(db.String(64), nullable=False, default="")
     ts_utc = db.Column(db.DateTime, nullable=False, default=lambda: datetime.utcnow(), index=True)
+    message_id = db.Column(db.String(255), nullable=True, unique=True, index=True)  # set by importers, for de-duplication
+    urgency = db.Column(db.Float, nullable=True)     # 0..1, from mail_scoring at write time
+    sentiment = db.Column(db.Float, nullable=True)   # -1..1
+
+# Mood ranking key: mail not scored yet counts as not urgent. Focus moods walk
+# the first index backwards (most urgent, newest first); calm moods walk the
+# second forwards (least urgent, newest first within a score).
+# (0.0 is inlined, not bound: SQLite only uses an expression index whose
+# expression matches the query's text exactly)
+EMAIL_URGENCY_KEY = func.coalesce(EmailMessage.urgency, literal_column("0.0"))
+db.Index("ix_email_message_folder_urgency_key", EmailMessage.folder, EMAIL_URGENCY_KEY,
+         EmailMessage.ts_utc, EmailMessage.id)
+db.Index("ix_email_message_folder_urgency_key_calm", EmailMessage.folder, EMAIL_URGENCY_KEY,
+         EmailMessage.ts_utc.desc(), EmailMessage.id.desc())
+
+# indexes from earlier schema versions that no longer match any query
+RETIRED_INDEXES = ("ix_email_message_folder_urgency_ts",)
+
+# Per-emotion sample counts per UTC hour / UTC day, maintained on every mood
+# write so range summaries never scan raw mood_log rows
+class MoodRollupHourly(db.Model):
+    __tablename__ = "mood_rollup_hourly"
+    bucket_utc = db.Column(db.DateTime, primary_key=True)   # start of the UTC hour
+    emotion = db.Column(db.String(32), primary_key=True)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+
+class MoodRollupDaily(db.Model):
+    __tablename__ = "mood_rollup_daily"
+    bucket_utc = db.Column(db.DateTime, primary_key=True)   # UTC midnight
+    emotion = db.Column(db.String(32), primary_key=True)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+
+def _floor_hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def _floor_day(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _ceil(ts, floor_fn, step):
+    f = floor_fn(ts)
+    return f if f == ts else f + step
+
+def _upsert_rollup(model, counts):
+    if not counts:
+        return
+    dialect_insert = pg_dialect.insert if db.engine.dialect.name == "postgresql" else sqlite_dialect.insert
+    ins = dialect_insert(model).values([
+        {"bucket_utc": b, "emotion": e, "samples": n} for (b, e), n in counts.items()])
+    db.session.execute(ins.on_conflict_do_update(
+        index_elements=["bucket_utc", "emotion"],
+        set_={"samples": model.samples + ins.excluded.samples}))
+
+# add mood rows (dicts with ts_utc/emotion, optional samples) to both
+# rollups, in the caller's transaction
+def bump_mood_rollups(rows):
+    hourly, daily = {}, {}
+    for r in rows:
+        n = r.get("samples") or 1
+        hk = (_floor_hour(r["ts_utc"]), r["emotion"])
+        dk = (_floor_day(r["ts_utc"]), r["emotion"])
+        hourly[hk] = hourly.get(hk, 0) + n
+        daily[dk] = daily.get(dk, 0) + n
+    _upsert_rollup(MoodRollupHourly, hourly)
+    _upsert_rollup(MoodRollupDaily, daily)
+
+# Recompute the rollups from mood_log, streaming rows and committing every
+# chunk. Meant as a one-off with the app stopped. Compacted rows keep only
+# the dominant emotion of their bucket, so hourly rollups from before the
+# compaction watermark (counted from full-resolution rows at write time) are
+# kept; raw rows are recounted, weighted by samples, only from there on. The
+# daily table is then rebuilt from the hourly one.
+def backfill_mood_rollups(chunk=5000):
+    keep_before = None
+    state = db.session.get(MaintenanceState, "compact:mood_log")
+    if state is not None:
+        keep_before = _floor_hour(datetime.fromisoformat(state.value))
+        if MoodRollupHourly.query.filter(MoodRollupHourly.bucket_utc < keep_before).first() is None:
+            keep_before = None   # nothing to keep: rebuild from the compacted rows as they are
+    hourly_q = MoodRollupHourly.query
+    q = db.session.query(MoodLog.ts_utc, MoodLog.emotion, func.coalesce(MoodLog.samples, 1))
+    if keep_before is not None:
+        hourly_q = hourly_q.filter(MoodRollupHourly.bucket_utc >= keep_before)
+        q = q.filter(MoodLog.ts_utc >= keep_before)
+    hourly_q.delete(synchronize_session=False)
+    MoodRollupDaily.query.delete()
+    db.session.commit()
 
-with app.app_context():
-    db.create_all()
-
-    # Seed emails on first run
-    if EmailMessage.query.count() == 0:
-        seed = [
-            dict(sender="SIM <noreply@123.sg>", to="you@local",
-                 subject="Welcome to the project collaboration Platform",
-                 content="Dear TAN ,\n\nWe are pleased to introduce our new platform.\n\nLogin Here https://project.com\n\nBest regards,\nSIM IT Services",
-                 folder="inbox", starred=False, read=False, date_str="Tue, 4 Jun 2025, 3:34 PM"),
-            dict(sender="Coursera <no-reply@coursera.org>", to="you@local",
-                 subject="Reminder - CM9999 Final Project Deadline",
-                 content="Hi TAN ,\n\nThis is a reminder that your final project for CM9999 is due on 7 June 2025, 11:59 PM.\n\nMake sure to upload your report and code before the deadline.\n\nRegards,\nCoursera Academic Team",
-                 folder="inbox", starred=True, read=False, date_str="Mon, 3 Jun 2025, 9:29 PM"),
-            dict(sender="SIM Admin <noreply@sim.sg>", to="you@local",
-                 subject="Midterm Webinar Invitation",
-                 content="Dear TAN ,\n\nYou're invited to join the Midterm Project Webinar on Thursday, 6 June at 3 PM via Zoom.\n\nMeeting Link: https://zoom\n\nBest regards,\nCM9999 Team",
-                 folder="inbox", starred=False, read=True, date_str="Mon, 3 Jun 2025, 11:51 AM"),
-            dict(sender="Figma Team <team@figma.com>", to="you@local",
-                 subject="Project Design Handoff Ready",
-                 content="Hello Team,\n\nThe UI handoff for the Emotion-Aware Dashboard is now ready.\n\nClick to review: https://figma.com/file\n\nThanks,\nFigma",
-                 folder="inbox", starred=False, read=True, date_str="Sun, 2 Jun 2025, 4:12 PM"),
-            dict(sender="Zoom <no-reply@zoom.us>", to="you@local",
-                 subject="Meeting Invite: Final Sprint ",
-                 content="You are invited to the Final Sprint presentation.\n\nDate: Sunday, 2 June\nTime: 10:00 AM\nZoom Link: https://zoom.us\n\nSee you there!",
-                 folder="inbox", starred=False, read=True, date_str="Sat, 1 Jun 2025, 2:00 PM"),
-        ]
-        for m in seed:
-            db.session.add(EmailMessage(**m))
-        db.session.commit()
+    total, hourly = 0, {}
+    for ts, emotion, n in q.order_by(MoodLog.ts_utc).execution_options(yield_per=chunk):
+        key = (_floor_hour(ts), emotion)
+        hourly[key] = hourly.get(key, 0) + n
+        total += 1
+        if total % chunk == 0:
+            _upsert_rollup(MoodRollupHourly, hourly)
+            db.session.commit()
+            hourly = {}
+    _upsert_rollup(MoodRollupHourly, hourly)
+    db.session.commit()
+
+    daily = {}
+    for bucket, emotion, n in (db.session.query(MoodRollupHourly.bucket_utc, MoodRollupHourly.emotion,
+                                                MoodRollupHourly.samples)
+                               .execution_options(yield_per=chunk)):
+        key = (_floor_day(bucket), emotion)
+        daily[key] = daily.get(key, 0) + n
+    _upsert_rollup(MoodRollupDaily, daily)
+    db.session.commit()
+    return total
+
+# Per-emotion counts over [utc_start, utc_end) from the rollups, grouped by
+# key_fn(bucket start). Full UTC days come from the daily table when
+# use_daily, whole hours from the hourly table, and the sub-hour edges left by
+# non-whole-hour time-zone offsets from raw rows, weighted by samples so
+# compacted rows count as many samples as they replaced. boundaries are the
+# UTC instants where key_fn's group changes; an hour that one of them cuts
+# through (half-hour offsets) is counted from raw rows, row by row.
+def mood_counts_from_rollups(utc_start, utc_end, key_fn, use_daily=True, boundaries=()):
+    out = {}
+    cut = {_floor_hour(b) for b in boundaries if b != _floor_hour(b)}
+    def add(key, emotion, n):
+        bucket = out.setdefault(key, {})
+        bucket[emotion] = bucket.get(emotion, 0) + int(n)
+
+    def raw(a, b):
+        if a >= b:
+            return
+        for emotion, n in (db.session.query(MoodLog.emotion, func.sum(func.coalesce(MoodLog.samples, 1)))
+                           .filter(MoodLog.ts_utc >= a, MoodLog.ts_utc < b)
+                           .group_by(MoodLog.emotion)):
+            add(key_fn(a), emotion, n)
+
+    def raw_rows(a, b):
+        for ts, emotion, n in (db.session.query(MoodLog.ts_utc, MoodLog.emotion, func.coalesce(MoodLog.samples, 1))
+                               .filter(MoodLog.ts_utc >= a, MoodLog.ts_utc < b)
+                               .execution_options(yield_per=5000)):
+            add(key_fn(ts), emotion, n)
+
+    def rolled(model, a, b):
+        if a >= b:
+            return
+        for bucket, emotion, n in (db.session.query(model.bucket_utc, model.emotion, model.samples)
+                                   .filter(model.bucket_utc >= a, model.bucket_utc < b)):
+            if bucket not in cut:
+                add(key_fn(bucket), emotion, n)
+
+    h0 = _ceil(utc_start, _floor_hour, timedelta(hours=1))
+    h1 = _floor_hour(utc_end)
+    if h0 >= h1:
+        raw(utc_start, utc_end)
+        return out
+    raw(utc_start, h0)
+    raw(h1, utc_end)
+    d0 = _ceil(h0, _floor_day, timedelta(days=1))
+    d1 = _floor_day(h1)
+    if use_daily and d0 < d1:
+        rolled(MoodRollupHourly, h0, d0)
+        rolled(MoodRollupDaily, d0, d1)
+        rolled(MoodRollupHourly, d1, h1)
+    else:
+        rolled(MoodRollupHourly, h0, h1)
+    # cut hours, merged into runs so hour-of-day groups are one scan
+    run_start = run_end = None
+    for hour in sorted(h for h in cut if h0 <= h < h1):
+        if hour != run_end:
+            if run_start is not None:
+                raw_rows(run_start, run_end)
+            run_start = hour
+        run_end = hour + timedelta(hours=1)
+    if run_start is not None:
+        raw_rows(run_start, run_end)
+    return out
+
+# Small key/value table for background-job bookkeeping (compaction watermarks)
+class MaintenanceState(db.Model):
+    __tablename__ = "maintenance_state"
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(64), nullable=False, default="")
+
+# Retention compaction. Each table has a watermark; everything before it is
+# already compacted. One call handles the next window after the watermark:
+# raw rows are grouped into buckets, replaced by one dominant-emotion row per
+# bucket, and the watermark advances, all in one short transaction. Claiming
+# the window is a compare-and-set on the watermark, so concurrent compactors
+# never process the same window twice. Manual journal entries are never touched.
+_EPOCH = datetime(1970, 1, 1)
+
+def _floor_bucket(ts):
+    secs = int((ts - _EPOCH).total_seconds()) // COMPACT_BUCKET_SECONDS * COMPACT_BUCKET_SECONDS
+    return _EPOCH + timedelta(seconds=secs)
+
+def _compacted_mood_row(bucket, emotion, n):
+    return {"ts_utc": bucket, "ts_iso": bucket.replace(tzinfo=timezone.utc).isoformat(),
+            "emotion": emotion, "note": f"{n} samples", "source": "compacted", "samples": n}
+
+def _compacted_label_row(bucket, emotion, n):
+    return {"ts_utc": bucket, "emotion": emotion}
+
+COMPACTION_JOBS = [
+    ("compact:mood_log", MoodLog, lambda: [MoodLog.source.notin_(("manual", "compacted"))], _compacted_mood_row),
+    ("compact:groq_label", GroqLabel, lambda: [], _compacted_label_row),
+]
+
+def compact_next_window(key, model, keep, make_row, cutoff):
+    filters = keep()
+    state = db.session.get(MaintenanceState, key)
+    if state is not None:
+        wm = datetime.fromisoformat(state.value)
+    else:
+        first = db.session.query(func.min(model.ts_utc)).filter(*filters).scalar()
+        if first is None:
+            return False
+        wm = _floor_bucket(first)
+    end_limit = _floor_bucket(cutoff)
+    if wm >= end_limit:
+        return False
+    window_end = min(wm + timedelta(seconds=COMPACT_BUCKET_SECONDS * COMPACT_BATCH_BUCKETS), end_limit)
+
+    in_window = [model.ts_utc >= wm, model.ts_utc < window_end, *filters]
+    rows = db.session.query(model.ts_utc, model.emotion).filter(*in_window).all()
+    if not rows:
+        # skip straight over gaps in the history
+        nxt = db.session.query(func.min(model.ts_utc)).filter(model.ts_utc >= window_end, *filters).scalar()
+        window_end = min(_floor_bucket(nxt), end_limit) if nxt else end_limit
 
-    # Seed tasks on first run
-    if Task.query.count() == 0:
-        for t in [
-            dict(text="Update Website", done=False, priority="high", quick=True),
-            dict(text="Reply HR Email", done=False, priority="medium", quick=True),
-            dict(text="Check on Stocks", done=False, priority="low", quick=False),
-            dict(text="Meeting With Clients", done=False, priority="high", quick=False),
-        ]:
-            db.session.add(Task(**t))
+    try:
+        if state is None:
+            db.session.add(MaintenanceState(key=key, value=window_end.isoformat()))
+            db.session.flush()
+        else:
+            claimed = (MaintenanceState.query
+                       .filter_by(key=key, value=state.value)
+                       .update({"value": window_end.isoformat()}, synchronize_session=False))
+            if not claimed:
+                db.session.rollback()
+                return False
+
+        if rows:
+            buckets = {}
+            for ts, emotion in rows:
+                counts = buckets.setdefault(_floor_bucket(ts), {})
+                counts[emotion] = counts.get(emotion, 0) + 1
+            compacted = []
+            for bucket, counts in sorted(buckets.items()):
+                emotion = max(counts, key=counts.get)
+                compacted.append(make_row(bucket, emotion, sum(counts.values())))
+            model.query.filter(*in_window).delete(synchronize_session=False)
+            db.session.execute(insert(model), compacted)
         db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
+
+# Move a watermark back to ts so rows written behind it (imports of older
+# history) are compacted on the next run; runs in the caller's transaction,
+# and a compactor that claimed the old value loses its compare-and-set
+def rewind_compaction(key, ts):
+    wm = _floor_bucket(ts).isoformat()
+    (MaintenanceState.query
+     .filter(MaintenanceState.key == key, MaintenanceState.value > wm)
+     .update({"value": wm}, synchronize_session=False))
+
+def compact_history(cutoff=None, pause=COMPACT_PAUSE_SECONDS):
+    if MOOD_RETENTION_HOURS <= 0:
+        return 0
+    cutoff = cutoff or datetime.utcnow() - timedelta(hours=MOOD_RETENTION_HOURS)
+    windows = 0
+    for job in COMPACTION_JOBS:
+        while compact_next_window(*job, cutoff):
+            windows += 1
+            if job[1] is GroqLabel:
+                versions.bump("labels")
+            time.sleep(pause)
+    return windows
+
+# Background thread that runs compact_history periodically (video process only)
+class RetentionCompactor:
+    def __init__(self, every=None):
+        self.every = COMPACT_EVERY_SECONDS if every is None else every
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and MOOD_RETENTION_HOURS > 0:
+            self._thread = threading.Thread(target=self._run, name="retention-compactor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with app.app_context():
+                    compact_history()
+            except Exception as e:
+                print("Retention compaction failed:", e)
+            time.sleep(self.every)
+
+compactor = RetentionCompactor()
+
+# Fill urgency/sentiment on EmailMessage objects or column dicts in one
+# vectorized pass (mail_scoring pulls in NumPy, so it loads on first use)
+def score_emails(items):
+    if not items:
+        return
+    import mail_scoring
+    get = (lambda it, k: it.get(k)) if isinstance(items[0], dict) else getattr
+    urgency, sentiment = mail_scoring.score_batch([get(it, "subject") for it in items],
+                                                  [get(it, "content") for it in items])
+    for it, u, s in zip(items, urgency, sentiment):
+        if isinstance(it, dict):
+            it["urgency"], it["sentiment"] = u, s
+        else:
+            it.urgency, it.sentiment = u, s
+
+def _email_text_changed(m):
+    state = sa_inspect(m)
+    return any(state.attrs[k].history.has_changes() for k in ("subject", "content"))
+
+# Mail created or edited through the ORM (draft, send, seed) is scored in the
+# flush that writes it; bulk imports call score_emails on their rows directly
+@event.listens_for(db.session, "before_flush")
+def _score_email_changes(session, flush_context, instances):
+    score_emails([o for o in session.new if isinstance(o, EmailMessage)] +
+                 [o for o in session.dirty if isinstance(o, EmailMessage) and _email_text_changed(o)])
+
+# Score unscored mail (or all of it with rescore=True, after lexicon changes)
+# EMAIL_SCORE_CHUNK rows per transaction, walking the primary key
+def backfill_email_scores(rescore=False, chunk=EMAIL_SCORE_CHUNK):
+    done, last_id = 0, 0
+    while True:
+        q = select(EmailMessage.id, EmailMessage.subject, EmailMessage.content).where(EmailMessage.id > last_id)
+        if not rescore:
+            q = q.where(EmailMessage.urgency.is_(None))
+        rows = [dict(r._mapping) for r in db.session.execute(q.order_by(EmailMessage.id).limit(chunk))]
+        if not rows:
+            break
+        score_emails(rows)
+        db.session.execute(update(EmailMessage),
+                           [{"id": r["id"], "urgency": r["urgency"], "sentiment": r["sentiment"]} for r in rows])
+        db.session.commit()
+        done += len(rows)
+        last_id = rows[-1]["id"]
+    if done:
+        versions.bump("emails")
+    return done
+
+# Full-text index over email sender/subject/content (SQLite FTS5, external
+# content). Triggers keep it in sync with every insert, delete and
+# sender/subject/content update, whichever route or importer makes them;
+# flag-only updates (starred/read/folder) don't touch it.
+EMAIL_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS email_fts USING fts5(
+        sender, subject, content,
+        content='email_message', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS email_fts_ai AFTER INSERT ON email_message BEGIN
+        INSERT INTO email_fts(rowid, sender, subject, content)
+        VALUES (new.id, new.sender, new.subject, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS email_fts_ad AFTER DELETE ON email_message BEGIN
+        INSERT INTO email_fts(email_fts, rowid, sender, subject, content)
+        VALUES ('delete', old.id, old.sender, old.subject, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS email_fts_au AFTER UPDATE OF sender, subject, content ON email_message BEGIN
+        INSERT INTO email_fts(email_fts, rowid, sender, subject, content)
+        VALUES ('delete', old.id, old.sender, old.subject, old.content);
+        INSERT INTO email_fts(rowid, sender, subject, content)
+        VALUES (new.id, new.sender, new.subject, new.content);
+    END""",
+]
+
+def email_search_enabled():
+    return db.engine.dialect.name == "sqlite"
+
+def rebuild_email_fts():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO email_fts(email_fts) VALUES ('rebuild')")
+
+def ensure_email_fts():
+    with db.engine.begin() as conn:
+        existed = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='email_fts'").first() is not None
+        for ddl in EMAIL_FTS_DDL:
+            conn.exec_driver_sql(ddl)
+    if not existed:
+        rebuild_email_fts()
+
+# In-place migration for existing databases: create_all() skips tables that
+# already exist, so add any (nullable) columns and indexes they are missing
+def migrate_schema():
+    inspector = sa_inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        have = {c["name"] for c in inspector.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in have:
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN "{col.name}" {col.type.compile(db.engine.dialect)}'
+                with db.engine.begin() as conn:
+                    conn.exec_driver_sql(ddl)
+        # IF NOT EXISTS rather than checkfirst: expression indexes can't be reflected
+        with db.engine.begin() as conn:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+    with db.engine.begin() as conn:
+        for name in RETIRED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    if db.engine.dialect.name == "sqlite":
+        ensure_email_fts()
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
+
+@app.cli.command("backfill-mood-rollups")
+def backfill_mood_rollups_command():
+    """Rebuild the hourly/daily mood rollups from mood_log (run with the app stopped)."""
+    n = backfill_mood_rollups()
+    print("mood rollups rebuilt from", n, "mood rows")
+
+@app.cli.command("compact-history")
+def compact_history_command():
+    """Compact mood_log/groq_label rows older than the retention window now."""
+    print("compacted windows:", compact_history())
+
+# Bulk import: stream records, insert them IMPORT_CHUNK at a time (one
+# transaction per chunk), skipping ones already stored and reporting progress
+IMPORT_CHUNK = 500
+
+def _import_chunked(items, parse, insert_chunk, chunk, label):
+    started = time.monotonic()
+    read = inserted = failed = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted
+        if batch:
+            inserted += insert_chunk(batch)
+            db.session.commit()
+            batch.clear()
+        rate = read / max(time.monotonic() - started, 1e-6)
+        click.echo(f"{label}: {read} read, {inserted} inserted, {read - inserted - failed} duplicates, "
+                   f"{failed} unreadable ({rate:.0f}/s)", err=True)
+
+    for item in items:
+        read += 1
+        try:
+            batch.append(parse(item))
+        except Exception as e:
+            failed += 1
+            click.echo(f"{label}: skipping record {read}: {e}", err=True)
+            continue
+        if len(batch) >= chunk:
+            flush()
+    flush()
+    return inserted
+
+def _insert_new_emails(rows):
+    ids = {r["message_id"] for r in rows}
+    seen = {mid for (mid,) in db.session.query(EmailMessage.message_id).filter(EmailMessage.message_id.in_(ids))}
+    fresh = []
+    for r in rows:
+        if r["message_id"] not in seen:
+            seen.add(r["message_id"])
+            fresh.append(r)
+    if fresh:
+        score_emails(fresh)
+        db.session.execute(insert(EmailMessage), fresh)
+    return len(fresh)
+
+def _insert_new_moods(rows):
+    stamps = {r["ts_utc"] for r in rows}
+    seen = {ts for (ts,) in db.session.query(MoodLog.ts_utc).filter(MoodLog.ts_utc.in_(stamps))}
+    fresh = []
+    for r in rows:
+        if r["ts_utc"] not in seen:
+            seen.add(r["ts_utc"])
+            fresh.append(r)
+    if fresh:
+        db.session.execute(insert(MoodLog), fresh)
+        bump_mood_rollups(fresh)
+        compactable = [r["ts_utc"] for r in fresh if r.get("source") not in ("manual", "compacted")]
+        if compactable:
+            rewind_compaction("compact:mood_log", min(compactable))
+    return len(fresh)
+
+@app.cli.command("import-mail")
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--format", "fmt", type=click.Choice(["auto", "mbox", "maildir"]), default="auto")
+@click.option("--folder", default="inbox", type=click.Choice(["inbox", "sent", "draft"]))
+@click.option("--chunk", default=IMPORT_CHUNK, show_default=True)
+def import_mail_command(path, fmt, folder, chunk):
+    """Import an mbox file or Maildir directory, skipping known Message-IDs."""
+    if fmt == "auto":
+        fmt = "maildir" if os.path.isdir(path) else "mbox"
+    raws = importers.iter_maildir(path) if fmt == "maildir" else importers.iter_mbox(path)
+    n = _import_chunked(raws, lambda raw: importers.parse_email(raw, folder), _insert_new_emails, chunk, "import-mail")
+    versions.bump("emails")
+    click.echo(f"imported {n} messages into {folder}")
+
+@app.cli.command("import-moods")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk", default=IMPORT_CHUNK * 2, show_default=True)
+def import_moods_command(path, chunk):
+    """Import mood history from a JSON array (like mood_log.json) or NDJSON, skipping known timestamps."""
+    n = _import_chunked(importers.iter_json_records(path), importers.parse_mood,
+                        _insert_new_moods, chunk, "import-moods")
+    click.echo(f"imported {n} mood entries")
+
+@app.cli.command("score-emails")
+@click.option("--all", "rescore", is_flag=True, help="Rescore every message, not just unscored ones.")
+@click.option("--chunk", default=EMAIL_SCORE_CHUNK, show_default=True, help="Rows per transaction.")
+def score_emails_command(rescore, chunk):
+    """Compute urgency/sentiment scores for stored mail."""
+    print("scored", backfill_email_scores(rescore=rescore, chunk=chunk), "emails")
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Rebuild the email full-text index from email_message."""
+    ensure_email_fts()
+    rebuild_email_fts()
+    print("email_fts rebuilt:", EmailMessage.query.count(), "messages")
+
+# Create tables, apply migrations and seed first-run data. Run once per
+# deployment via `flask --app app init-db` (python app.py does it on start);
+# importing the app never touches the schema.
+def init_db():
+    with app.app_context():
+        db.create_all()
+        migrate_schema()
+
+        # First run with rollups: fill them from existing mood history once
+        if MoodRollupHourly.query.first() is None and MoodLog.query.first() is not None:
+            print("Backfilling mood rollups:", backfill_mood_rollups(), "rows")
+
+        # Compacted rows written before mood_log.samples existed carry the
+        # count only in their note ("<n> samples")
+        for row in MoodLog.query.filter(MoodLog.source == "compacted", MoodLog.samples.is_(None)):
+            head = row.note.split(" ", 1)[0]
+            row.samples = int(head) if head.isdigit() else 1
+        db.session.commit()
+
+        # Mail stored before scoring existed
+        if EmailMessage.query.filter(EmailMessage.urgency.is_(None)).first() is not None:
+            print("Scoring emails:", backfill_email_scores(), "rows")
+
+        # Seed emails on first run
+        if EmailMessage.query.count() == 0:
+            seed = [
+                dict(sender="SIM <noreply@123.sg>", to="you@local",
+                     subject="Welcome to the project collaboration Platform",
+                     content="Dear TAN ,\n\nWe are pleased to introduce our new platform.\n\nLogin Here https://project.com\n\nBest regards,\nSIM IT Services",
+                     folder="inbox", starred=False, read=False, date_str="Tue, 4 Jun 2025, 3:34 PM"),
+                dict(sender="Coursera <no-reply@coursera.org>", to="you@local",
+                     subject="Reminder - CM9999 Final Project Deadline",
+                     content="Hi TAN ,\n\nThis is a reminder that your final project for CM9999 is due on 7 June 2025, 11:59 PM.\n\nMake sure to upload your report and code before the deadline.\n\nRegards,\nCoursera Academic Team",
+                     folder="inbox", starred=True, read=False, date_str="Mon, 3 Jun 2025, 9:29 PM"),
+                dict(sender="SIM Admin <noreply@sim.sg>", to="you@local",
+                     subject="Midterm Webinar Invitation",
+                     content="Dear TAN ,\n\nYou're invited to join the Midterm Project Webinar on Thursday, 6 June at 3 PM via Zoom.\n\nMeeting Link: https://zoom\n\nBest regards,\nCM9999 Team",
+                     folder="inbox", starred=False, read=True, date_str="Mon, 3 Jun 2025, 11:51 AM"),
+                dict(sender="Figma Team <team@figma.com>", to="you@local",
+                     subject="Project Design Handoff Ready",
+                     content="Hello Team,\n\nThe UI handoff for the Emotion-Aware Dashboard is now ready.\n\nClick to review: https://figma.com/file\n\nThanks,\nFigma",
+                     folder="inbox", starred=False, read=True, date_str="Sun, 2 Jun 2025, 4:12 PM"),
+                dict(sender="Zoom <no-reply@zoom.us>", to="you@local",
+                     subject="Meeting Invite: Final Sprint ",
+                     content="You are invited to the Final Sprint presentation.\n\nDate: Sunday, 2 June\nTime: 10:00 AM\nZoom Link: https://zoom.us\n\nSee you there!",
+                     folder="inbox", starred=False, read=True, date_str="Sat, 1 Jun 2025, 2:00 PM"),
+            ]
+            for m in seed:
+                db.session.add(EmailMessage(**m))
+            db.session.commit()
+
+        # Seed tasks on first run
+        if Task.query.count() == 0:
+            for t in [
+                dict(text="Update Website", done=False, priority="high", quick=True),
+                dict(text="Reply HR Email", done=False, priority="medium", quick=True),
+                dict(text="Check on Stocks", done=False, priority="low", quick=False),
+                dict(text="Meeting With Clients", done=False, priority="high", quick=False),
+            ]:
+                db.session.add(Task(**t))
+            db.session.commit()
+
+        # A new or reset database must not match ETags handed out for the
+        # previous one (the stamps live outside the database file)
+        versions.bump(*ResourceVersions.RESOURCES)
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create tables, apply schema migrations and seed first-run data."""
+    init_db()
+    print("database ready:", app.config["SQLALCHEMY_DATABASE_URI"])
+
+# App factory for WSGI servers: gunicorn "app:create_app()" for the process
+# that serves the video pipeline, create_app("api") for headless workers.
+# Only a full process runs the background compactor; the camera, OpenCV and
+# DeepFace load on first use either way.
+def create_app(mode=None):
+    mode = mode or APP_MODE
+    if mode not in ("full", "api"):
+        raise ValueError(f"unknown APP_MODE {mode!r} (expected 'full' or 'api')")
+    app.config["APP_MODE"] = mode
+    if mode == "full":
+        compactor.start()
+    return app
+
+def serves_video():
+    return app.config["APP_MODE"] == "full"
+
+# Camera & CV: loaded on first use so API-only workers never import
+# OpenCV/NumPy or open the webcam
+cv2 = np = None
+camera = None
+face_cascade = None
+_vision_lock = threading.Lock()
+
+def load_vision():
+    global cv2, np
+    if cv2 is None:
+        with _vision_lock:
+            if cv2 is None:
+                import numpy as np
+                import cv2
+    return cv2
 
-# Camera & CV
 def _open_camera():
     cam = cv2.VideoCapture(0)
     if not cam or not cam.isOpened():
         cam = cv2.VideoCapture(0, cv2.CAP_DSHOW)  
     return cam
 
-camera = _open_camera()
-if camera and camera.isOpened():
-    camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+def get_camera():
+    global camera
+    load_vision()
+    with _vision_lock:
+        if camera is None:
+            camera = _open_camera()
+            if camera and camera.isOpened():
+                camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    return camera
+
+def get_face_cascade():
+    global face_cascade
+    load_vision()
+    with _vision_lock:
+        if face_cascade is None:
+            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return face_cascade
 
 # Short, randomized activities per emotion (3–8 words)
 RANDOM_ACTIVITIES = {
@@ -143,6 +887,93 @@ LABEL_MAP = {
     "angry":"Angry", "disgust":"Stressed", "fear":"Anxious",
     "happy":"Happy", "sad":"Sad", "surprise":"Focused", "neutral":"Calm"
 }
+# Stage timing hooks: callables (stage, seconds) notified by the vision
+# pipeline, the Groq call and the write-behind flush (see bench.py).
+# Nothing is timed while the list is empty.
+stage_observers = []
+
+def observe_stage(stage, seconds):
+    for fn in stage_observers:
+        fn(stage, seconds)
+
+# Process-local Prometheus registry: one latency histogram per pipeline stage
+# (fed through stage_observers) plus labelled counters and callback gauges.
+class Metrics:
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    COUNTERS = {
+        "frames_total": "Frames read from the camera",
+        "frames_dropped_total": "Frames a stream client skipped because it fell behind",
+        "camera_read_failures_total": "camera.read() calls that returned no frame",
+        "groq_requests_total": "Groq HTTP attempts by outcome",
+        "groq_errors_total": "Groq analyses that failed, by reason",
+        "groq_cache_total": "Groq cache lookups by result (hit, miss, stale)",
+        "emotion_inference_failures_total": "Local emotion inference batches that failed",
+        "db_flush_failures_total": "Write-behind flushes that failed and were requeued",
+        "ingest_frames_total": "Uploaded frames by outcome",
+    }
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hist = {}       # stage -> [bucket counts..., +Inf count], sum
+        self._counters = {}   # (name, sorted label items) -> value
+        self._gauges = {}     # name -> (help, fn)
+
+    def observe(self, stage, seconds):
+        i = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            h = self._hist.get(stage)
+            if h is None:
+                h = self._hist[stage] = [[0] * (len(self.BUCKETS) + 1), 0.0]
+            h[0][i] += 1
+            h[1] += seconds
+
+    def inc(self, name, n=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge(self, name, help_text, fn):
+        self._gauges[name] = (help_text, fn)
+
+    def render(self):
+        out = []
+        with self._lock:
+            hist = {k: (list(v[0]), v[1]) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+        out.append("# HELP emodash_stage_seconds Latency of each pipeline stage")
+        out.append("# TYPE emodash_stage_seconds histogram")
+        for stage in sorted(hist):
+            buckets, total = hist[stage]
+            cum = 0
+            for le, n in zip(self.BUCKETS + ("+Inf",), buckets):
+                cum += n
+                out.append(f'emodash_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cum}')
+            out.append(f'emodash_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            out.append(f'emodash_stage_seconds_count{{stage="{stage}"}} {cum}')
+        for name, help_text in self.COUNTERS.items():
+            out.append(f"# HELP emodash_{name} {help_text}")
+            out.append(f"# TYPE emodash_{name} counter")
+            series = [(labels, v) for (n, labels), v in counters.items() if n == name]
+            for labels, v in sorted(series) or [((), 0)]:
+                lbl = ",".join(f'{k}="{val}"' for k, val in labels)
+                out.append(f"emodash_{name}{{{lbl}}} {v}" if lbl else f"emodash_{name} {v}")
+        for name, (help_text, fn) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            out.append(f"# HELP emodash_{name} {help_text}")
+            out.append(f"# TYPE emodash_{name} gauge")
+            out.append(f"emodash_{name} {value}")
+        return "\n".join(out) + "\n"
+
+metrics = Metrics(enabled=METRICS_ENABLED)
+if METRICS_ENABLED:
+    stage_observers.append(metrics.observe)
+
 #current UTC time in ISO 8601
 def now_iso_utc():
     return datetime.now(timezone.utc).isoformat()
@@ -154,25 +985,154 @@ def encode_frame_to_base64(frame):
         return ""
     return base64.b64encode(buffer).decode('utf-8')
 
-# DeepFace on face crop and returns emotion label
-def detect_emotion_local(face_img):
-    try:
-        analysis = DeepFace.analyze(
-            face_img,
-            actions=['emotion'],
-            detector_backend='opencv',
-            enforce_detection=False
-        )
-        payload = analysis[0] if isinstance(analysis, list) else analysis
-        emotions = payload.get('emotion') or {}
-        if not emotions:
-            return "Unknown"
-        top = max(emotions, key=emotions.get)
-        conf = emotions[top]
-        return f"{top.capitalize()} ({conf:.2f})"
-    except Exception as e:
-        print("Emotion detection error:", str(e))
+# top emotion of a score dict -> overlay label, e.g. "Happy (82.10)"
+def format_emotion_label(scores):
+    if not scores:
         return "Unknown"
+    top = max(scores, key=scores.get)
+    return f"{top.capitalize()} ({scores[top]:.2f})"
+
+# Decides when a face crop needs a fresh local inference pass and smooths the
+# per-emotion score vector with an EMA; frames in between reuse the last result.
+class EmotionScheduler:
+    def __init__(self, interval=None, min_interval=None, box_shift=None, alpha=None):
+        self.interval = EMOTION_INFER_INTERVAL if interval is None else interval
+        self.min_interval = EMOTION_MIN_INTERVAL if min_interval is None else min_interval
+        self.box_shift = EMOTION_BOX_SHIFT if box_shift is None else box_shift
+        self.alpha = EMOTION_EMA_ALPHA if alpha is None else alpha
+        self.scores = {}
+        self.last_run = float("-inf")
+        self.last_box = None
+        self.failed = False   # last pass returned no scores
+
+    def _moved(self, box):
+        x, y, w, h = box
+        lx, ly, lw, lh = self.last_box
+        size = max(lw, lh, 1)
+        shift = max(abs((x + w / 2) - (lx + lw / 2)), abs((y + h / 2) - (ly + lh / 2))) / size
+        scale = abs(w * h - lw * lh) / max(lw * lh, 1)
+        return shift > self.box_shift or scale > self.box_shift
+
+    def due(self, box, now):
+        age = now - self.last_run
+        if age >= self.interval:
+            return True
+        # after a failed pass wait out the full interval instead of retrying every frame
+        if self.failed:
+            return False
+        return age >= self.min_interval and (self.last_box is None or self._moved(box))
+
+    def update(self, scores, box, now):
+        self.last_run = now
+        self.last_box = box
+        self.failed = not scores
+        if not scores:
+            return
+        if not self.scores:
+            self.scores = dict(scores)
+            return
+        a = self.alpha
+        self.scores = {k: a * scores.get(k, 0.0) + (1 - a) * self.scores.get(k, 0.0)
+                       for k in set(scores) | set(self.scores)}
+
+    def lost(self):
+        # face left the frame: the next one gets a fresh pass
+        self.last_box = None
+
+    def label(self):
+        return format_emotion_label(self.scores)
+
+# Shared emotion inference service. Any producer submits a face crop and gets
+# a Future of its score dict; a batcher thread groups pending crops into
+# micro-batches (up to batch_max, or whatever arrived within batch_wait_ms of
+# the first) and runs each batch in a worker process that loaded the model
+# once, so streams share CPU cores without contending for the GIL.
+class EmotionInferenceService:
+    def __init__(self, workers=None, batch_max=None, batch_wait_ms=None):
+        self.workers = EMOTION_WORKERS if workers is None else workers
+        self.batch_max = EMOTION_BATCH_MAX if batch_max is None else batch_max
+        self.batch_wait = (EMOTION_BATCH_WAIT_MS if batch_wait_ms is None else batch_wait_ms) / 1000.0
+        self._pending = queue.Queue()
+        self._inflight = threading.BoundedSemaphore(max(self.workers, 1) * 2)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+
+    def submit(self, face_img):
+        fut = Future()
+        self._pending.put((face_img, fut))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="emotion-batcher", daemon=True)
+                self._thread.start()
+        return fut
+
+    def _get_executor(self):
+        import emotion_worker
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=emotion_worker.init_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, initializer=emotion_worker.init_worker)
+        return self._executor
+
+    def _next_batch(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self._inflight.acquire()
+            try:
+                started = time.perf_counter()
+                import emotion_worker
+                job = self._get_executor().submit(emotion_worker.infer_batch, [c for c, _ in batch])
+            except Exception as e:
+                print("Emotion inference submit failed:", e)
+                metrics.inc("emotion_inference_failures_total")
+                self._executor = None
+                self._inflight.release()
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            job.add_done_callback(lambda job, batch=batch, started=started: self._resolve(job, batch, started))
+
+    def _resolve(self, job, batch, started):
+        self._inflight.release()
+        if stage_observers:
+            observe_stage("infer_batch", time.perf_counter() - started)
+        try:
+            results = job.result()
+        except Exception as e:
+            print("Emotion inference failed:", e)
+            metrics.inc("emotion_inference_failures_total")
+            # a dead worker breaks the whole pool; rebuild it on the next batch
+            self._executor = None
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), scores in zip(batch, results):
+            fut.set_result(scores)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+emotion_service = EmotionInferenceService()
+atexit.register(emotion_service.shutdown)
     
 # extract emotion and activity from Groq reply
 def parse_groq_json(content: str):
@@ -189,22 +1149,225 @@ def parse_groq_json(content: str):
     return {"emotion": (obj.get("emotion") or "Unknown").strip(),
             "activity": (obj.get("activity") or "").strip()}
 
-def commit_safe(objs):
-    if not isinstance(objs, (list, tuple)):
-        objs = [objs]
-    def _do():
-        for o in objs: db.session.add(o)
-        db.session.commit()
+# Identifies this process; prefixes event ids so a resume against a
+# restarted server isn't mistaken for one against this event history
+BOOT_ID = uuid.uuid4().hex[:8]
+
+# In-process pub/sub for pipeline events (label, mood, suggestion). Keeps the
+# last EVENT_BACKLOG events so SSE clients can resume from Last-Event-ID.
+class EventBus:
+    def __init__(self, backlog=None):
+        self._events = deque(maxlen=EVENT_BACKLOG if backlog is None else backlog)
+        self._cond = threading.Condition()
+        self._seq = 0
+
+    def publish(self, kind, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, kind, json.dumps(data)))
+            self._cond.notify_all()
+
+    def _parse_last_id(self, last_event_id):
+        boot, _, seq = (last_event_id or "").partition("-")
+        if boot != BOOT_ID or not seq.isdigit():
+            return None
+        return int(seq)
+
+    # id of the newest event, for listeners that must not miss what follows
+    def last_event_id(self):
+        with self._cond:
+            return f"{BOOT_ID}-{self._seq}"
+
+    # backlog events after last_event_id as (event_id, kind, json), without waiting
+    def replay(self, last_event_id):
+        with self._cond:
+            last = self._parse_last_id(last_event_id)
+            if last is None:
+                return []
+            return [(f"{BOOT_ID}-{seq}", kind, data) for seq, kind, data in self._events if seq > last]
+
+    # yields (event_id, kind, json) as events arrive, or None after
+    # keepalive seconds of silence
+    def listen(self, last_event_id=None, keepalive=None):
+        keepalive = EVENT_KEEPALIVE_SECONDS if keepalive is None else keepalive
+        with self._cond:
+            last = self._parse_last_id(last_event_id)
+            if last is None or last > self._seq:
+                last = self._seq
+        while True:
+            with self._cond:
+                if self._seq == last:
+                    self._cond.wait(timeout=keepalive)
+                pending = [e for e in self._events if e[0] > last]
+            if not pending:
+                yield None
+                continue
+            for seq, kind, data in pending:
+                last = seq
+                yield f"{BOOT_ID}-{seq}", kind, data
+
+event_bus = EventBus()
+
+# Per-resource change stamps behind the ETags of the read endpoints. Routes
+# and the analysis write path bump them after committing, so a conditional
+# GET whose If-None-Match still matches is answered with 304 before any query
+# runs. Stamps are random tokens in small marker files (VERSIONS_DIR, default
+# instance/versions) so every process on the host agrees: a label written by
+# the video process or a CLI import invalidates the tags an API worker hands out.
+class ResourceVersions:
+    RESOURCES = ("tasks", "emails", "labels", "suggestion")
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv("VERSIONS_DIR") or os.path.join(app.instance_path, "versions")
+
+    def bump(self, *names):
+        os.makedirs(self.root, exist_ok=True)
+        for name in names:
+            path = os.path.join(self.root, name)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w") as f:
+                f.write(uuid.uuid4().hex)
+            try:
+                os.replace(tmp, path)
+            except OSError:   # Windows: target held open by a reader
+                os.remove(tmp)
+                with open(path, "w") as f:
+                    f.write(uuid.uuid4().hex)
+
+    def etag(self, name, variant=b""):
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                v = f.read()
+        except OSError:
+            v = "0"
+        return f"{name}-{v}-{zlib.crc32(variant):08x}"
+
+versions = ResourceVersions()
+
+# Serve a GET with a weak ETag from versions[resource] (varying by query
+# string); matching If-None-Match returns 304 without calling the view
+def conditional(resource):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            tag = versions.etag(resource, request.full_path.encode())
+            if request.if_none_match.contains_weak(tag):
+                resp = Response(status=304)
+            else:
+                resp = app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(tag, weak=True)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+def in_app_context(fn):
     if has_app_context():
-        _do()
-    else:
-        with app.app_context():
-            _do()
+        return fn()
+    with app.app_context():
+        return fn()
+
+# Write-behind buffer for analysis rows (GroqLabel, MoodLog, Suggestion).
+# Rows are collected in memory and written with one bulk INSERT per model in
+# a single transaction, when max_rows are pending or every flush_seconds,
+# and once more at interpreter exit.
+class WriteBehindBuffer:
+    def __init__(self, max_rows=None, flush_seconds=None):
+        self.max_rows = WRITE_BEHIND_MAX_ROWS if max_rows is None else max_rows
+        self.flush_seconds = WRITE_BEHIND_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._rows = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, model, **row):
+        with self._lock:
+            self._rows.setdefault(model, []).append(row)
+            self._count += 1
+            full = self._count >= self.max_rows
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._rows, self._count = self._rows, {}, 0
+            if not pending:
+                return
+            t0 = time.perf_counter()
+            def _do():
+                try:
+                    for model, rows in pending.items():
+                        db.session.execute(insert(model), rows)
+                        if model is MoodLog:
+                            bump_mood_rollups(rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            try:
+                in_app_context(_do)
+            except Exception as e:
+                print("Write-behind flush failed:", e)
+                metrics.inc("db_flush_failures_total")
+                self._requeue(pending)
+                return
+            observe_stage("persist", time.perf_counter() - t0)
+            if GroqLabel in pending:
+                versions.bump("labels")
+            if Suggestion in pending:
+                versions.bump("suggestion")
+
+    def _requeue(self, pending):
+        # keep failed rows for the next flush, bounded so a dead DB can't eat memory
+        with self._lock:
+            for model, rows in pending.items():
+                merged = rows + self._rows.get(model, [])
+                self._rows[model] = merged[-self.max_rows * 20:]
+            self._count = sum(len(r) for r in self._rows.values())
+
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.flush)
+metrics.gauge("write_behind_pending_rows", "Rows buffered for the next write-behind flush", lambda: write_behind._count)
+
+# In-memory suggestion cooldown, seeded once from the newest stored suggestion
+_cooldown_lock = threading.Lock()
+_last_suggestion_at = None
+
+def _claim_suggestion_slot(now):
+    global _last_suggestion_at
+    with _cooldown_lock:
+        if _last_suggestion_at is None:
+            last = in_app_context(lambda: db.session.query(func.max(Suggestion.ts_utc)).scalar())
+            _last_suggestion_at = last or datetime.min
+        if (now - _last_suggestion_at).total_seconds() < SUGGESTION_COOLDOWN_SECONDS:
+            return False
+        _last_suggestion_at = now
+        return True
 
 def random_activity_for(emotion: str) -> str:
     arr = RANDOM_ACTIVITIES.get((emotion or "").lower(), [])
     return random.choice(arr) if arr else ""
 
+# store a Groq (or cached Groq) emotion; negative ones get a random short activity
+def record_groq_emotion(emotion):
+    neg = {"Stressed","Angry","Sad","Tired","Anxious"}
+    activity = random_activity_for(emotion) if emotion in neg else ""
+    add_suggestion_with_cooldown(emotion, activity)
+
 
 # store label/mood; write suggestion with cooldown
 def add_suggestion_with_cooldown(emotion: str, activity: str):
@@ -213,30 +1376,131 @@ def add_suggestion_with_cooldown(emotion: str, activity: str):
         now = datetime.utcnow()
 
         # Always persist label & mood
-        commit_safe([
-            GroqLabel(emotion=emotion),
-            MoodLog(emotion=emotion, note="", source="auto")
-        ])
+        ts_iso = now.replace(tzinfo=timezone.utc).isoformat()
+        write_behind.add(GroqLabel, ts_utc=now, emotion=emotion)
+        write_behind.add(MoodLog, ts_utc=now, ts_iso=ts_iso, emotion=emotion, note="", source="auto")
+        event_bus.publish("label", {"ts": ts_iso, "emotion": emotion})
+        event_bus.publish("mood", {"ts": ts_iso, "emotion": emotion, "note": "", "source": "auto"})
 
         neg_emotions = {"Stressed", "Angry", "Sad", "Tired", "Anxious"}
         if emotion not in neg_emotions or not activity:
             return
 
-        last = (Suggestion.query
-                .order_by(Suggestion.ts_utc.desc())
-                .with_entities(Suggestion.ts_utc)
-                .first())
-
-        if last is not None:
-            age = (now - (last[0] or now)).total_seconds()
-            if age < SUGGESTION_COOLDOWN_SECONDS:
-                return  
+        if not _claim_suggestion_slot(now):
+            return
 
-        commit_safe(Suggestion(emotion=emotion, activity=activity))
+        write_behind.add(Suggestion, ts_utc=now, emotion=emotion, activity=activity)
+        event_bus.publish("suggestion", {"emotion": emotion, "activity": activity})
 
     except Exception as e:
         print("add_suggestion_with_cooldown failed:", e)
 
+# Keep-alive session shared by all Groq calls (one TLS handshake, reused sockets)
+def _make_groq_session():
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+groq_session = _make_groq_session()
+
+# POST to Groq, retrying connection errors, timeouts, 429 and 5xx
+def _post_groq(headers, data):
+    resp = None
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(random.uniform(0, min(GROQ_BACKOFF_CAP, GROQ_BACKOFF_BASE * 2 ** attempt)))
+        t0 = time.perf_counter() if stage_observers else 0
+        try:
+            resp = groq_session.post(GROQ_URL, headers=headers, json=data, timeout=GROQ_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.inc("groq_requests_total", outcome="timeout" if isinstance(e, requests.Timeout) else "connection")
+            if attempt == GROQ_MAX_RETRIES:
+                raise
+            print("Groq request retry:", e)
+            continue
+        finally:
+            if stage_observers:
+                observe_stage("groq_post", time.perf_counter() - t0)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            metrics.inc("groq_requests_total", outcome=str(resp.status_code))
+            print("Groq retryable status:", resp.status_code)
+            continue
+        metrics.inc("groq_requests_total", outcome="ok" if resp.ok else str(resp.status_code))
+        return resp
+    return resp
+
+# 64-bit perceptual hash of a crop: sign of the low-frequency DCT
+# coefficients of its 32x32 grayscale thumbnail against their median
+def perceptual_hash(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()[1:]   # drop the DC term
+    return int.from_bytes(np.packbits(low > np.median(low)).tobytes(), "big")
+
+# Bounded LRU of recent Groq answers keyed on the crop's perceptual hash plus
+# the smoothed local scores at the time. A lookup hits when some entry is
+# within max_bits Hamming distance and every local score is within
+# max_score_delta points; a match older than max_age is "stale" and forces a
+# fresh call, which then replaces it.
+class GroqCache:
+    def __init__(self, size=None, max_age=None, max_bits=None, max_score_delta=None):
+        self.size = GROQ_CACHE_SIZE if size is None else size
+        self.max_age = GROQ_CACHE_MAX_AGE_SECONDS if max_age is None else max_age
+        self.max_bits = GROQ_CACHE_MAX_BITS if max_bits is None else max_bits
+        self.max_score_delta = GROQ_CACHE_MAX_SCORE_DELTA if max_score_delta is None else max_score_delta
+        self._entries = OrderedDict()   # phash -> (scores, emotion, stored_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = 0
+
+    def _close(self, a, b):
+        return all(abs(a.get(k, 0.0) - b.get(k, 0.0)) <= self.max_score_delta for k in set(a) | set(b))
+
+    def _match(self, phash, scores):
+        best = None
+        for key, entry in self._entries.items():
+            bits = bin(key ^ phash).count("1")
+            if bits <= self.max_bits and (best is None or bits < best[0]) and self._close(entry[0], scores):
+                best = (bits, key)
+        return None if best is None else best[1]
+
+    # cached emotion for a near-duplicate crop, or None
+    def get(self, phash, scores):
+        if self.size <= 0:
+            return None
+        with self._lock:
+            key = self._match(phash, scores)
+            if key is None:
+                self.misses += 1
+                result = "miss"
+            elif time.monotonic() - self._entries[key][2] > self.max_age:
+                del self._entries[key]
+                self.stale += 1
+                result = "stale"
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.inc("groq_cache_total", result="hit")
+                return self._entries[key][1]
+        metrics.inc("groq_cache_total", result=result)
+        return None
+
+    def put(self, phash, scores, emotion):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(phash, None)
+            self._entries[phash] = (dict(scores), emotion, time.monotonic())
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+groq_cache = GroqCache()
+metrics.gauge("groq_cache_entries", "Groq answers held in the result cache", lambda: len(groq_cache))
+
 # Groq emotion analysis
 def analyse_with_groq(face_b64):
     if not GROQ_API_KEY:
@@ -262,76 +1526,386 @@ def analyse_with_groq(face_b64):
     }
 
     try:
-        resp = requests.post(GROQ_URL, headers=headers, json=data, timeout=20)
+        resp = _post_groq(headers, data)
         print("Groq response status:", resp.status_code)
         if not resp.ok:
             print("Groq error:", resp.text[:400])
+            metrics.inc("groq_errors_total", reason="http")
             return "Error from Groq"
 
         content = resp.json()["choices"][0]["message"]["content"]
         parsed = parse_groq_json(content)
         emotion = parsed["emotion"] or "Unknown"
-
-        # Randomize short activity for negative emotions
-        neg = {"Stressed","Angry","Sad","Tired","Anxious"}
-        activity = random_activity_for(emotion) if emotion in neg else ""
-
-        add_suggestion_with_cooldown(emotion, activity)
+        record_groq_emotion(emotion)
         return emotion
     except Exception as e:
         print("Groq API call failed:", e)
+        metrics.inc("groq_errors_total", reason="request")
         return "Groq request failed"
 
 def map_local_to_label(text):
     base = (text.split()[0] if text else "").lower()
     return LABEL_MAP.get(base, "Calm")
 
-# webcam MJPEG stream + periodic Groq
-def gen_frames():
-    last_groq_time = 0
-    while True:
-        if not camera or not camera.isOpened():
-            time.sleep(0.1)
-            continue
-
-        ok, frame = camera.read()
-        if not ok:
-            time.sleep(0.05)
-            continue
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(80,80))
+# Background Groq worker: the frame loop hands over the newest face crop and
+# moves on; a slow or failing API never delays frames. The queue holds one
+# item, so a pending crop is replaced by a fresher one instead of piling up.
+class GroqWorker:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, face_img, local_label, scores=None):
+        item = (face_img.copy(), local_label, dict(scores or {}))
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    pass
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="groq-worker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            face_img, local_label, scores = self._queue.get()
+            try:
+                with app.app_context():
+                    wrote = False
+                    if GROQ_API_KEY:
+                        phash = perceptual_hash(face_img)
+                        emo = groq_cache.get(phash, scores)
+                        if emo is not None:
+                            record_groq_emotion(emo)
+                            wrote = True
+                        else:
+                            t0 = time.perf_counter()
+                            emo = analyse_with_groq(encode_frame_to_base64(face_img))
+                            observe_stage("groq", time.perf_counter() - t0)
+                            wrote = emo not in ("Groq request failed", "Error from Groq", "Groq key missing")
+                            if wrote and emo != "Unknown":
+                                groq_cache.put(phash, scores, emo)
+                    if not wrote:
+                        add_suggestion_with_cooldown(map_local_to_label(local_label), "")
+            except Exception as e:
+                print("Groq worker failed:", e)
+            finally:
+                self._queue.task_done()
+
+    # block until every submitted frame has been analysed or replaced
+    def drain(self):
+        self._queue.join()
+
+groq_worker = GroqWorker()
+
+# Detect-then-track face localization. The Haar cascade runs on a downscaled
+# grayscale frame only every detect_every frames (or when tracking is lost);
+# in between the last face patch is template-matched in a window around its
+# previous position. Boxes are returned in full-resolution coordinates.
+class FaceLocalizer:
+    def __init__(self, detect_every=None, scale=None, min_score=None):
+        self.detect_every = FACE_DETECT_EVERY if detect_every is None else detect_every
+        self.scale = FACE_DETECT_SCALE if scale is None else scale
+        self.min_score = FACE_TRACK_MIN_SCORE if min_score is None else min_score
+        self._template = None
+        self._small_box = None
+        self._since_detect = 0
+
+    def locate(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        box = None
+        if self._template is not None and self._since_detect < self.detect_every:
+            box = self._track(gray)
+        if box is None:
+            box = self._detect(gray)
+        if box is None:
+            return None
+        self._since_detect += 1
+        return self._to_full(box, frame.shape)
+
+    def _detect(self, gray):
+        self._since_detect = 0
+        min_side = max(int(min(gray.shape) * FACE_MIN_FRACTION), 24)
+        t0 = time.perf_counter() if stage_observers else 0
+        faces = get_face_cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(min_side, min_side))
+        if stage_observers:
+            observe_stage("detect", time.perf_counter() - t0)
+        if len(faces) == 0:
+            self._template = None
+            self._small_box = None
+            return None
+        x, y, w, h = (int(v) for v in max(faces, key=lambda b: b[2]*b[3]))
+        self._template = gray[y:y+h, x:x+w].copy()
+        self._small_box = (x, y, w, h)
+        return self._small_box
+
+    def _track(self, gray):
+        x, y, w, h = self._small_box
+        pad = max(w, h) // 2
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        x1, y1 = min(x + w + pad, gray.shape[1]), min(y + h + pad, gray.shape[0])
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            return None
+        res = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(res)
+        if score < self.min_score:
+            return None
+        self._small_box = (x0 + mx, y0 + my, w, h)
+        return self._small_box
+
+    def _to_full(self, box, shape):
+        x, y, w, h = (int(round(v / self.scale)) for v in box)
+        x, y = max(x, 0), max(y, 0)
+        return x, y, min(w, shape[1] - x), min(h, shape[0] - y)
+
+# per-stream analysis: face crop -> local emotion -> periodic Groq -> overlay
+class VisionPipeline:
+    def __init__(self, detect_scale=None):
+        load_vision()
+        self.last_groq_time = 0
+        self.localizer = FaceLocalizer(scale=detect_scale)
+        self.emotions = EmotionScheduler()
+        self._pending = None   # (Future, box, submitted_at) for the crop being scored
+        self.faces = 0
+
+    # fold a finished inference result into the smoothed scores
+    def _collect(self):
+        fut, box, started = self._pending
+        if not fut.done():
+            return
+        self._pending = None
+        try:
+            scores = fut.result()
+        except Exception:
+            scores = {}
+        if stage_observers:
+            observe_stage("infer", time.monotonic() - started)
+        self.emotions.update(scores, box, started)
+
+    # locate and score the face, handing the crop to Groq every
+    # GROQ_INTERVAL_SECONDS; returns (label, box), box None when no face.
+    # wait > 0 blocks up to that many seconds for the crop submitted now, so
+    # the label describes this frame (the camera loop never waits).
+    def analyse(self, frame, wait=0):
+        timed = bool(stage_observers)
+        t0 = time.perf_counter() if timed else 0
+        box = self.localizer.locate(frame)
+        if timed:
+            observe_stage("locate", time.perf_counter() - t0)
 
         detected = "No face detected"
-        if len(faces) > 0:
-            x, y, w, h = sorted(faces, key=lambda b: b[2]*b[3], reverse=True)[0]
+        if box is not None:
+            self.faces += 1
+            x, y, w, h = box
+            t0 = time.perf_counter() if timed else 0
             face_img = frame[y:y+h, x:x+w]
             try:
                 face_img_resized = cv2.resize(face_img, (224,224))
             except Exception:
                 face_img_resized = face_img
-
-            detected = detect_emotion_local(face_img_resized)
-
-            # Groq every 10s. 
-            if time.time() - last_groq_time > 10:
-                wrote = False
-                if GROQ_API_KEY:
-                    face_b64 = encode_frame_to_base64(face_img_resized)
-                    emo = analyse_with_groq(face_b64)
-                    wrote = emo not in ("Groq request failed", "Error from Groq", "Groq key missing")
-                if not wrote:
-                    normalized = map_local_to_label(detected)
-                    add_suggestion_with_cooldown(normalized, "")  
-                last_groq_time = time.time()
-
+            if timed:
+                observe_stage("crop", time.perf_counter() - t0)
+
+            if self._pending is not None:
+                self._collect()
+            now = time.monotonic()
+            if self._pending is None and self.emotions.due((x, y, w, h), now):
+                self._pending = (emotion_service.submit(face_img_resized), (x, y, w, h), now)
+                if wait:
+                    try:
+                        self._pending[0].result(timeout=wait)
+                    except Exception:
+                        pass   # timed out or failed: _collect picks it up later
+                    self._collect()
+            detected = self.emotions.label()
+
+            # Groq every 10s, off the frame path
+            if time.time() - self.last_groq_time > GROQ_INTERVAL_SECONDS:
+                groq_worker.submit(face_img_resized, detected, self.emotions.scores)
+                self.last_groq_time = time.time()
+        else:
+            self.emotions.lost()
+        return detected, box
+
+    # analyse and draw the box and label onto the frame
+    def process(self, frame):
+        detected, box = self.analyse(frame)
+        if box is not None:
+            x, y, w, h = box
             cv2.rectangle(frame, (x,y), (x+w,y+h), (0,255,0), 2)
             cv2.putText(frame, detected, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255,255,0), 2, cv2.LINE_AA)
+        return frame
 
+    # annotated frame -> JPEG bytes for the MJPEG stream (None if encoding failed)
+    def encode(self, frame):
+        t0 = time.perf_counter() if stage_observers else 0
         ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        if stage_observers:
+            observe_stage("encode", time.perf_counter() - t0)
+        return buffer.tobytes() if ok else None
+
+# webcam frames -> analysed JPEG bytes (None while the camera has nothing to give)
+def camera_frames():
+    pipeline = VisionPipeline()
+    camera = get_camera()
+    while True:
+        if not camera or not camera.isOpened():
+            time.sleep(0.1)
+            yield None
+            continue
+
+        t0 = time.perf_counter() if stage_observers else 0
+        ok, frame = camera.read()
         if not ok:
+            metrics.inc("camera_read_failures_total")
+            time.sleep(0.05)
+            yield None
             continue
-        yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+        if stage_observers:
+            observe_stage("read", time.perf_counter() - t0)
+        metrics.inc("frames_total")
+
+        yield pipeline.encode(pipeline.process(frame))
+
+# One producer thread runs the source and publishes the latest JPEG;
+# subscribers always read the newest frame, so slow clients skip frames
+# instead of stalling the producer. Stops after idle_timeout with no viewers.
+class FrameBroadcaster:
+    def __init__(self, source, idle_timeout=5.0):
+        self._source = source
+        self._idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._subscribers = 0
+        self._thread = None
+
+    def _ensure_running(self):
+        # caller holds self._cond
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="frame-producer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        idle_since = None
+        try:
+            for jpg in self._source():
+                with self._cond:
+                    if jpg is not None:
+                        self._frame = jpg
+                        self._seq += 1
+                        self._cond.notify_all()
+                    if self._subscribers > 0:
+                        idle_since = None
+                        continue
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > self._idle_timeout:
+                        self._thread = None
+                        self._frame = None
+                        return
+        except Exception as e:
+            print("Frame producer failed:", e)
+        with self._cond:
+            self._thread = None
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            self._ensure_running()
+        last_seq = self._seq
+        try:
+            while True:
+                with self._cond:
+                    while self._seq == last_seq:
+                        self._ensure_running()
+                        self._cond.wait(timeout=1.0)
+                    if self._seq - last_seq > 1:
+                        metrics.inc("frames_dropped_total", self._seq - last_seq - 1)
+                    jpg, last_seq = self._frame, self._seq
+                yield jpg
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+broadcaster = FrameBroadcaster(camera_frames)
+metrics.gauge("stream_clients", "Connected MJPEG clients", lambda: broadcaster._subscribers)
+
+class IngestClient:
+    def __init__(self, addr):
+        self.id = uuid.uuid4().hex
+        self.addr = addr
+        self.pipeline = None
+        self.lock = threading.Lock()
+        self.last_frame = float("-inf")
+
+# Per-client state for uploaded frames: each session gets its own
+# VisionPipeline (tracking, EMA and Groq cadence stay per person), frames
+# closer together than min_interval are refused, and sessions idle for
+# idle_seconds are dropped. Session ids are random tokens issued here; an
+# unknown id opens a new session, at most max_per_addr per remote address,
+# so one peer cannot take every slot by inventing ids. Only the pipeline is
+# per session: the app is single-user, so Groq calls, the mood log,
+# suggestions and /events are shared by every uploader and the webcam.
+class IngestSessions:
+    def __init__(self, min_interval_ms=None, idle_seconds=None, max_clients=None, max_per_addr=None):
+        self.min_interval = (INGEST_MIN_INTERVAL_MS if min_interval_ms is None else min_interval_ms) / 1000.0
+        self.idle_seconds = INGEST_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.max_clients = INGEST_MAX_CLIENTS if max_clients is None else max_clients
+        self.max_per_addr = INGEST_MAX_CLIENTS_PER_ADDR if max_per_addr is None else max_per_addr
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._last_sweep = 0.0
+
+    def _evict(self, now):
+        self._last_sweep = now
+        for cid in [cid for cid, c in self._clients.items()
+                    if now - c.last_frame > self.idle_seconds and not c.lock.locked()]:
+            del self._clients[cid]
+
+    def _full(self, addr):
+        return (len(self._clients) >= self.max_clients
+                or sum(1 for c in self._clients.values() if c.addr == addr) >= self.max_per_addr)
+
+    # (client, 0) with client.lock held if a frame may be analysed now,
+    # (None, seconds to wait) if too soon, (None, None) if no session can be
+    # opened for addr. client.id is the session id to send next time.
+    def claim(self, client_id, addr, now):
+        with self._lock:
+            if now - self._last_sweep > self.idle_seconds / 4:
+                self._evict(now)
+            c = self._clients.get(client_id) if client_id else None
+            if c is None:
+                if self._full(addr):
+                    self._evict(now)
+                    if self._full(addr):
+                        return None, None
+                c = IngestClient(addr)
+                self._clients[c.id] = c
+            wait = c.last_frame + self.min_interval - now
+            if wait > 0 or not c.lock.acquire(blocking=False):
+                return None, max(wait, self.min_interval)
+            c.last_frame = now
+            return c, 0
+
+    def __len__(self):
+        return len(self._clients)
+
+ingest_sessions = IngestSessions()
+metrics.gauge("ingest_clients", "Clients with an active upload pipeline", lambda: len(ingest_sessions))
+
+# MJPEG stream for one client, fed by the shared producer
+def gen_frames():
+    for jpg in broadcaster.subscribe():
+        yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n')
 
 # LOCAL day window helper
 def _day_window_from_local(date_str: str, tz_offset_min: Optional[int]):
@@ -350,11 +1924,106 @@ def index():
 
 @app.route("/video_feed")
 def video_feed():
+    if not serves_video():
+        return jsonify({"error": "video is served by the full-mode process"}), 404
     return Response(stream_with_context(gen_frames()),
                     mimetype="multipart/x-mixed-replace; boundary=frame")
 
+# Frames or face crops uploaded by remote browsers go through the same
+# locate/infer/Groq/persist path as the server webcam; only the label comes back.
+@app.route("/api/frames", methods=["POST"])
+def api_frames():
+    """
+    Body: one JPEG/PNG frame or face crop, raw (Content-Type: image/jpeg) or as multipart field "frame".
+    Session: send back the X-Client-Id response header; without a valid one a new session is opened.
+    Labels feed the shared mood log, Groq results and /events, as the webcam's do.
+    Returns {"label", "face", "box"}; the label includes this frame when its inference finishes within
+    INGEST_INFER_WAIT_MS. 429 with retry_after_ms when sent faster than INGEST_MIN_INTERVAL_MS.
+    """
+    if not serves_video():
+        return jsonify({"error": "frames are analysed by the full-mode process"}), 404
+    if (request.content_length or 0) > INGEST_MAX_BYTES:
+        metrics.inc("ingest_frames_total", outcome="too_large")
+        return jsonify({"error": f"frame larger than {INGEST_MAX_BYTES} bytes"}), 413
+
+    client, wait = ingest_sessions.claim(request.headers.get("X-Client-Id"), request.remote_addr or "",
+                                         time.monotonic())
+    if client is None:
+        if wait is None:
+            metrics.inc("ingest_frames_total", outcome="server_full")
+            return jsonify({"error": "too many clients"}), 503
+        metrics.inc("ingest_frames_total", outcome="rate_limited")
+        resp = jsonify({"error": "too many frames", "retry_after_ms": int(wait * 1000) + 1})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(max(1, int(wait + 0.999)))
+        return resp
+
+    try:
+        body, status = _ingest_frame(client)
+    finally:
+        client.lock.release()
+    resp = jsonify(body)
+    resp.status_code = status
+    resp.headers["X-Client-Id"] = client.id
+    return resp
+
+# decode one uploaded frame and run it through the client's pipeline -> (json, status)
+def _ingest_frame(client):
+    upload = request.files.get("frame")
+    data = (upload.stream if upload else request.stream).read(INGEST_MAX_BYTES + 1)
+    if len(data) > INGEST_MAX_BYTES:
+        metrics.inc("ingest_frames_total", outcome="too_large")
+        return {"error": f"frame larger than {INGEST_MAX_BYTES} bytes"}, 413
+    load_vision()
+    t0 = time.perf_counter() if stage_observers else 0
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+    if frame is None:
+        metrics.inc("ingest_frames_total", outcome="bad_image")
+        return {"error": "body is not a decodable image"}, 400
+    if stage_observers:
+        observe_stage("decode", time.perf_counter() - t0)
+    if client.pipeline is None:
+        # cascade at ~320px wide whatever size this client sends
+        client.pipeline = VisionPipeline(detect_scale=min(1.0, 320.0 / frame.shape[1]))
+    label, box = client.pipeline.analyse(frame, wait=INGEST_INFER_WAIT_MS / 1000.0)
+    metrics.inc("ingest_frames_total", outcome="ok")
+    return {"label": label, "face": box is not None,
+            "box": [int(v) for v in box] if box is not None else None}, 200
+
+# Push stream of label/mood/suggestion events (text/event-stream).
+# Resumes after Last-Event-ID (header, or ?last_event_id= for manual reconnects);
+# /groq_results and /groq_suggestion remain as the polling fallback.
+@app.route("/events")
+def events():
+    # events are published in the full-mode process; headless workers send
+    # clients back to polling the status routes
+    if not serves_video():
+        return jsonify({"error": "event stream is served by the full-mode process"}), 404
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+
+    def stream():
+        yield "retry: 3000\n\n"
+        for ev in event_bus.listen(last_event_id):
+            if ev is None:
+                yield ": keepalive\n\n"
+                continue
+            eid, kind, data = ev
+            yield f"id: {eid}\nevent: {kind}\ndata: {data}\n\n"
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Prometheus text exposition of stage latencies and counters (404 when METRICS_ENABLED=0)
+@app.route("/metrics")
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({"error": "metrics disabled"}), 404
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8",
+                    headers={"Cache-Control": "no-cache"})
+
 # Status log: return ISO timestamps; frontend renders local times
 @app.route("/groq_results")
+@conditional("labels")
 def get_groq_results():
     rows = GroqLabel.query.order_by(GroqLabel.ts_utc.desc()).limit(10).all()
     out = []
@@ -364,6 +2033,7 @@ def get_groq_results():
     return jsonify(out)
 
 @app.route("/groq_suggestion")
+@conditional("suggestion")
 def get_groq_suggestion():
     s = Suggestion.query.order_by(Suggestion.ts_utc.desc()).first()
     if not s:
@@ -376,12 +2046,19 @@ def log_mood():
     try:
         data = request.get_json(force=True)
         entry = MoodLog(
+            ts_utc=datetime.utcnow(),
             emotion=data.get("emotion", "Unknown"),
             note=data.get("note", ""),
             source=data.get("source", "manual")
         )
         db.session.add(entry)
+        t0 = time.perf_counter() if stage_observers else 0
+        bump_mood_rollups([{"ts_utc": entry.ts_utc, "emotion": entry.emotion}])
         db.session.commit()
+        if stage_observers:
+            observe_stage("persist", time.perf_counter() - t0)
+        event_bus.publish("mood", {"ts": entry.ts_iso, "emotion": entry.emotion,
+                                   "note": entry.note, "source": entry.source})
         return jsonify({"ok": True})
     except Exception as e:
         db.session.rollback()
@@ -405,7 +2082,7 @@ def mood_entries():
         return jsonify([])
 
     rows = (MoodLog.query
-            .filter(MoodLog.ts_utc >= start, MoodLog.ts_utc < end)
+            .filter(MoodLog.ts_utc >= start, MoodLog.ts_utc < end, MoodLog.source != "compacted")
             .order_by(MoodLog.ts_utc.asc())
             .all())
 
@@ -436,17 +2113,147 @@ def mood_summary():
     except Exception:
         return jsonify({"counts": {}, "top_emotion": None})
 
-    rows = (db.session.query(MoodLog.emotion, func.count(MoodLog.id))
-            .filter(MoodLog.ts_utc >= start, MoodLog.ts_utc < end)
-            .group_by(MoodLog.emotion)
-            .all())
-
-    counts = {emo: int(n) for (emo, n) in rows}
+    counts = mood_counts_from_rollups(start, end, lambda _ts: "all").get("all", {})
     top_emotion = max(counts, key=counts.get) if counts else None
     return jsonify({"counts": counts, "top_emotion": top_emotion})
 
+@app.route("/mood_summary/range")
+def mood_summary_range():
+    """
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (LOCAL, inclusive); optional ?tz_offset_min=<int>
+    ?group=total (default) | day | hour (hour of local day, 0-23)
+    Answered from the hourly/daily rollups; cost is bounded by the range, not by raw rows,
+    except group=hour with a half-hour offset, where every hour is split from raw rows.
+    """
+    tz_offset_min = request.args.get("tz_offset_min", type=int)
+    group = request.args.get("group", "total")
+    if group not in ("total", "day", "hour"):
+        return jsonify({"error": "group must be total, day or hour"}), 400
+    try:
+        start, _ = _day_window_from_local(request.args["start"], tz_offset_min)
+        _, end = _day_window_from_local(request.args.get("end") or request.args["start"], tz_offset_min)
+    except Exception:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+    if end <= start:
+        return jsonify({"error": "end is before start"}), 400
+
+    offset = timedelta(minutes=tz_offset_min or 0)
+    boundaries = ()
+    if group == "total":
+        key_fn = lambda _ts: "all"
+    elif group == "day":
+        key_fn = lambda ts: (ts - offset).date().isoformat()
+        boundaries = [start + timedelta(days=i) for i in range(1, (end - start).days)]
+    else:
+        key_fn = lambda ts: (ts - offset).hour
+        boundaries = [start + timedelta(hours=i) for i in range(1, int((end - start).total_seconds()) // 3600)]
+    grouped = mood_counts_from_rollups(start, end, key_fn, use_daily=(group == "total"), boundaries=boundaries)
+
+    counts = grouped.get("all", {}) if group == "total" else {}
+    if group != "total":
+        for buckets in grouped.values():
+            for emo, n in buckets.items():
+                counts[emo] = counts.get(emo, 0) + n
+    top_emotion = max(counts, key=counts.get) if counts else None
+    out = {"counts": counts, "top_emotion": top_emotion}
+    if group != "total":
+        out["groups"] = {str(k): v for k, v in sorted(grouped.items())}
+    return jsonify(out)
+
+# Export: kind -> (model, [(output field, column)])
+def _iso_utc(ts):
+    return ts.replace(tzinfo=timezone.utc).isoformat() if ts else ""
+
+EXPORTS = {
+    "mood": (MoodLog, [("ts", lambda r: r.ts_iso or _iso_utc(r.ts_utc)), ("emotion", "emotion"),
+                       ("note", "note"), ("source", "source"),
+                       ("samples", lambda r: r.samples or 1)]),
+    "labels": (GroqLabel, [("ts", lambda r: _iso_utc(r.ts_utc)), ("emotion", "emotion")]),
+    "suggestions": (Suggestion, [("ts", lambda r: _iso_utc(r.ts_utc)), ("emotion", "emotion"),
+                                 ("activity", "activity")]),
+    "emails": (EmailMessage, [("id", "id"), ("message_id", "message_id"), ("ts", lambda r: _iso_utc(r.ts_utc)),
+                              ("date", "date_str"), ("folder", "folder"), ("sender", "sender"), ("to", "to"),
+                              ("subject", "subject"), ("starred", "starred"), ("read", "read"),
+                              ("content", "content")]),
+}
+
+# rows -> text chunks: the CSV header first (an empty chunk for NDJSON), then
+# EXPORT_FLUSH_ROWS rows at a time. The query itself has already run when the
+# route called execute(), so the header follows the statement, not precedes it;
+# later yield_per batches are fetched as the chunks are consumed. Under ?gzip=1
+# the encoder may hold the header back until enough data has arrived.
+def _export_lines(rows, fields, fmt):
+    getters = [(name, (lambda r, a=col: getattr(r, a)) if isinstance(col, str) else col) for name, col in fields]
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow([name for name, _ in fields])
+    yield buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    n = 0
+    for r in rows:
+        values = [get(r) for _, get in getters]
+        if writer:
+            writer.writerow(values)
+        else:
+            buf.write(json.dumps(dict(zip((name for name, _ in fields), values))) + "\n")
+        n += 1
+        if n % EXPORT_FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def _gzip_stream(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
+
+@app.route("/export/<kind>")
+def export_data(kind):
+    """
+    Stream mood | labels | suggestions | emails, oldest first.
+    ?format=csv (default) | ndjson; optional ?start=&end=YYYY-MM-DD (LOCAL, inclusive)
+    with ?tz_offset_min=; ?gzip=1 for a .gz download.
+    """
+    if kind not in EXPORTS:
+        return jsonify({"error": f"kind must be one of {', '.join(EXPORTS)}"}), 404
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    model, fields = EXPORTS[kind]
+    tz_offset_min = request.args.get("tz_offset_min", type=int)
+    stmt = select(model)
+    try:
+        if request.args.get("start"):
+            stmt = stmt.where(model.ts_utc >= _day_window_from_local(request.args["start"], tz_offset_min)[0])
+        if request.args.get("end"):
+            stmt = stmt.where(model.ts_utc < _day_window_from_local(request.args["end"], tz_offset_min)[1])
+    except ValueError:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+    stmt = stmt.order_by(model.ts_utc, model.id).execution_options(yield_per=EXPORT_YIELD_PER)
+    rows = db.session.execute(stmt).scalars()
+
+    body = _export_lines(rows, fields, fmt)
+    filename = f"{kind}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if request.args.get("gzip") in ("1", "true", "True"):
+        body = _gzip_stream(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    else:
+        body = (chunk.encode("utf-8") for chunk in body)
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                             "X-Accel-Buffering": "no"})
+
 #Tasks 
 @app.route("/api/tasks", methods=["GET"])
+@conditional("tasks")
 def api_tasks_list():
     rows = Task.query.order_by(Task.created_at.desc()).all()
     return jsonify([{
@@ -465,6 +2272,7 @@ def api_tasks_create():
     )
     db.session.add(t)
     db.session.commit()
+    versions.bump("tasks")
     return jsonify({"id": t.id}), 201
 
 @app.route("/api/tasks/<int:tid>", methods=["PATCH"])
@@ -476,6 +2284,7 @@ def api_tasks_update(tid):
     if "priority" in data: t.priority = (data["priority"] or t.priority)
     if "quick" in data: t.quick = bool(data["quick"])
     db.session.commit()
+    versions.bump("tasks")
     return jsonify({"ok": True})
 
 @app.route("/api/tasks/<int:tid>", methods=["DELETE"])
@@ -483,8 +2292,112 @@ def api_tasks_delete(tid):
     t = Task.query.get_or_404(tid)
     db.session.delete(t)
     db.session.commit()
+    versions.bump("tasks")
     return jsonify({"ok": True})
 
+# Batch task mutations: {"ops": [{"op": "create", "text", "priority", "done", "quick"},
+#                                 {"op": "update", "id", ...fields}, {"op": "delete", "id"}]}
+# Every op is validated first; any failure returns 400 with per-op results and
+# nothing is written. Otherwise all ops apply in one transaction (one
+# multi-row INSERT ... RETURNING id, one bulk UPDATE, one DELETE ... IN) and
+# per-op results are returned.
+TASK_BATCH_MAX_OPS = 500
+TASK_PRIORITIES = ("high", "medium", "low")
+
+# expected JSON types per batch op field (None is allowed for text/priority)
+TASK_OP_TYPES = {"id": (int,), "text": (str, type(None)), "done": (bool,),
+                 "priority": (str, type(None)), "quick": (bool,)}
+
+def _task_op_type_error(op):
+    for key, types in TASK_OP_TYPES.items():
+        if key in op and (not isinstance(op[key], types) or (bool not in types and isinstance(op[key], bool))):
+            return f"{key} has the wrong type"
+    return None
+
+def _task_fields(op):
+    fields = {}
+    if "text" in op:
+        fields["text"] = (op["text"] or "").strip()
+    if "done" in op:
+        fields["done"] = bool(op["done"])
+    if "priority" in op:
+        fields["priority"] = op["priority"] or "medium"
+    if "quick" in op:
+        fields["quick"] = bool(op["quick"])
+    return fields
+
+@app.route("/api/tasks/batch", methods=["POST"])
+def api_tasks_batch():
+    data = request.get_json(force=True, silent=True) or {}
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"ok": False, "error": "ops must be a non-empty list"}), 400
+    if len(ops) > TASK_BATCH_MAX_OPS:
+        return jsonify({"ok": False, "error": f"at most {TASK_BATCH_MAX_OPS} ops per batch"}), 400
+
+    ref_ids = {op.get("id") for op in ops if isinstance(op, dict) and _task_op_type_error(op) is None
+               and op.get("id") is not None}
+    existing = {tid for (tid,) in db.session.query(Task.id).filter(Task.id.in_(ref_ids))} if ref_ids else set()
+
+    results, creates, updates, deletes = [], [], {}, set()
+    for i, op in enumerate(ops):
+        kind = op.get("op") if isinstance(op, dict) else None
+        tid = op.get("id") if isinstance(op, dict) else None
+        error = None
+        if not isinstance(op, dict):
+            error = "op must be an object"
+        elif kind not in ("create", "update", "delete"):
+            error = "op must be create, update or delete"
+        elif _task_op_type_error(op):
+            error = _task_op_type_error(op)
+        elif (op.get("priority") or "medium") not in TASK_PRIORITIES:
+            error = "priority must be high, medium or low"
+        elif kind != "create" and not isinstance(tid, int):
+            error = "id is required"
+        elif kind != "create" and (tid not in existing or tid in deletes):
+            error = "task not found"
+        results.append({"index": i, "op": kind, "id": tid, "ok": error is None, **({"error": error} if error else {})})
+        if error:
+            continue
+        fields = _task_fields(op)
+        if kind == "create":
+            creates.append((i, {"text": fields.get("text") or "Untitled Task",
+                                "done": fields.get("done", False),
+                                "priority": fields.get("priority", "medium"),
+                                "quick": fields.get("quick", False)}))
+        elif kind == "update":
+            if fields.get("text") == "":
+                del fields["text"]
+            updates.setdefault(tid, {"id": tid}).update(fields)
+        else:
+            deletes.add(tid)
+            updates.pop(tid, None)
+
+    if not all(r["ok"] for r in results):
+        return jsonify({"ok": False, "results": results}), 400
+
+    try:
+        new_ids = []
+        if creates:
+            # one multi-row INSERT assigns ascending ids in row order, but RETURNING
+            # order is unspecified (asking SQLAlchemy to keep it costs one INSERT per row)
+            new_ids = sorted(db.session.execute(insert(Task).returning(Task.id),
+                                                [row for _, row in creates]).scalars())
+        mappings = [m for m in updates.values() if len(m) > 1]
+        if mappings:
+            db.session.bulk_update_mappings(Task, mappings)
+        if deletes:
+            Task.query.filter(Task.id.in_(deletes)).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": str(e)}), 500
+    versions.bump("tasks")
+
+    for (i, _), tid in zip(creates, new_ids):
+        results[i]["id"] = tid
+    return jsonify({"ok": True, "results": results})
+
 #Emails 
 def _format_email(m: EmailMessage):
     return {
@@ -496,21 +2409,161 @@ def _format_email(m: EmailMessage):
         "folder": m.folder,
         "starred": m.starred,
         "read": m.read,
-        "date": m.date_str
+        "date": m.date_str,
+        "urgency": m.urgency,
+        "sentiment": m.sentiment
+    }
+
+# List view projection: everything but the body, plus a short preview
+EMAIL_LIST_COLUMNS = (
+    EmailMessage.id, EmailMessage.sender, EmailMessage.to, EmailMessage.subject,
+    EmailMessage.folder, EmailMessage.starred, EmailMessage.read, EmailMessage.date_str,
+    EmailMessage.ts_utc, EmailMessage.urgency, EmailMessage.sentiment,
+    func.substr(EmailMessage.content, 1, EMAIL_PREVIEW_CHARS).label("preview"),
+)
+
+def _format_email_row(r):
+    return {
+        "id": r.id,
+        "sender": r.sender,
+        "to": r.to,
+        "subject": r.subject,
+        "preview": r.preview,
+        "folder": r.folder,
+        "starred": r.starred,
+        "read": r.read,
+        "date": r.date_str,
+        "urgency": r.urgency,
+        "sentiment": r.sentiment
     }
 
+# keyset cursor over (ts_utc, id), or (urgency, ts_utc, id) for mood-ranked
+# pages; opaque to clients
+def _encode_cursor(ts, rid, urgency=None):
+    raw = f"{ts.isoformat()}|{rid}" + ("" if urgency is None else f"|{urgency!r}")
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    parts = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    urgency = float(parts[2]) if len(parts) > 2 else None
+    return datetime.fromisoformat(parts[0]), int(parts[1]), urgency
+
 @app.route("/api/emails", methods=["GET"])
+@conditional("emails")
 def api_emails_list():
+    """
+    ?folder=&starred=; ?limit=<1..EMAIL_PAGE_MAX>&cursor=<next_cursor from previous page>
+    ?mood=<emotion>: rank by urgency (folder defaults to inbox). EMAIL_CALM_MOODS get the
+    calmest mail first and hide urgency >= EMAIL_HIDE_URGENCY; EMAIL_FOCUS_MOODS get the most urgent first.
+    Unscored mail counts as urgency 0. Returns {"items": [...], "next_cursor": str|null}, newest first
+    (within each urgency when ranked), without bodies.
+    """
     folder = request.args.get("folder")
     starred = request.args.get("starred")
-    q = EmailMessage.query
+    mood = request.args.get("mood")
+    if mood and mood not in EMAIL_CALM_MOODS + EMAIL_FOCUS_MOODS:
+        return jsonify({"error": f"unknown mood {mood!r}"}), 400
+    if mood and not folder and starred is None:
+        folder = "inbox"
+    limit = max(1, min(request.args.get("limit", EMAIL_PAGE_DEFAULT, type=int), EMAIL_PAGE_MAX))
+    q = db.session.query(*EMAIL_LIST_COLUMNS)
     if folder:
         q = q.filter(EmailMessage.folder == folder)
     if starred is not None:
         want = starred in ("1","true","True")
         q = q.filter(EmailMessage.starred == want)
-    rows = q.order_by(EmailMessage.ts_utc.desc()).all()
-    return jsonify([_format_email(m) for m in rows])
+    calm = mood in EMAIL_CALM_MOODS
+    key = EMAIL_URGENCY_KEY
+    if calm:
+        q = q.filter(key < EMAIL_HIDE_URGENCY)
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            ts, rid, urgency = _decode_cursor(cursor)
+        except Exception:
+            return jsonify({"error": "bad cursor"}), 400
+        if mood and urgency is None:
+            return jsonify({"error": "bad cursor"}), 400
+        if not mood:
+            q = q.filter(tuple_(EmailMessage.ts_utc, EmailMessage.id) < tuple_(ts, rid))
+        elif calm:
+            # urgency ascending, then (ts, id) descending; key >= urgency seeks the index
+            q = q.filter(key >= urgency, or_(key > urgency,
+                                             tuple_(EmailMessage.ts_utc, EmailMessage.id) < tuple_(ts, rid)))
+        else:
+            q = q.filter(key <= urgency,
+                         tuple_(key, EmailMessage.ts_utc, EmailMessage.id) < tuple_(urgency, ts, rid))
+
+    if not mood:
+        order = (EmailMessage.ts_utc.desc(), EmailMessage.id.desc())
+    elif calm:
+        order = (key, EmailMessage.ts_utc.desc(), EmailMessage.id.desc())
+    else:
+        order = (key.desc(), EmailMessage.ts_utc.desc(), EmailMessage.id.desc())
+    rows = q.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last.ts_utc, last.id, (last.urgency or 0.0) if mood else None)
+    return jsonify({"items": [_format_email_row(r) for r in rows[:limit]], "next_cursor": next_cursor})
+
+# user text -> FTS5 query: each word quoted (no operator injection), last one as a prefix
+def _fts_query(text_in):
+    words = re.findall(r"\w+", text_in or "", flags=re.UNICODE)
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words[:-1]) + (" " if len(words) > 1 else "") + f'"{words[-1]}"*'
+
+@app.route("/api/emails/search", methods=["GET"])
+@conditional("emails")
+def api_emails_search():
+    """
+    ?q=<text>; optional ?folder=&starred=; ?limit=<1..EMAIL_PAGE_MAX>&offset=
+    Best matches first (bm25, subject weighted over sender over body).
+    Returns {"items": [... + "snippet"], "next_offset": int|null}.
+    """
+    if not email_search_enabled():
+        return jsonify({"error": "search requires SQLite FTS5"}), 501
+    match = _fts_query(request.args.get("q"))
+    if not match:
+        return jsonify({"items": [], "next_offset": None})
+    limit = max(1, min(request.args.get("limit", EMAIL_PAGE_DEFAULT, type=int), EMAIL_PAGE_MAX))
+    offset = max(0, request.args.get("offset", 0, type=int))
+
+    where = ["email_fts MATCH :match"]
+    params = {"match": match, "limit": limit + 1, "offset": offset, "preview": EMAIL_PREVIEW_CHARS}
+    folder = request.args.get("folder")
+    if folder:
+        where.append("m.folder = :folder")
+        params["folder"] = folder
+    starred = request.args.get("starred")
+    if starred is not None:
+        where.append("m.starred = :starred")
+        params["starred"] = starred in ("1","true","True")
+
+    rows = db.session.execute(text(f"""
+        SELECT m.id, m.sender, m."to", m.subject, m.folder, m.starred, m.read, m.date_str,
+               m.urgency, m.sentiment, substr(m.content, 1, :preview) AS preview,
+               snippet(email_fts, 2, '[', ']', '…', 12) AS snippet
+        FROM email_fts JOIN email_message AS m ON m.id = email_fts.rowid
+        WHERE {" AND ".join(where)}
+        ORDER BY bm25(email_fts, 5.0, 10.0, 1.0)
+        LIMIT :limit OFFSET :offset"""), params).all()
+
+    items = []
+    for r in rows[:limit]:
+        item = _format_email_row(r)
+        item["starred"] = bool(r.starred)
+        item["read"] = bool(r.read)
+        item["snippet"] = r.snippet
+        items.append(item)
+    return jsonify({"items": items, "next_offset": offset + limit if len(rows) > limit else None})
+
+@app.route("/api/emails/<int:eid>", methods=["GET"])
+@conditional("emails")
+def api_emails_get(eid):
+    m = EmailMessage.query.get_or_404(eid)
+    return jsonify(_format_email(m))
 
 @app.route("/api/emails/draft", methods=["POST"])
 def api_emails_save_draft():
@@ -526,6 +2579,7 @@ def api_emails_save_draft():
         m.folder = "draft"
         m.date_str = date_str
         db.session.commit()
+        versions.bump("emails")
         return jsonify({"id": m.id})
     else:
         m = EmailMessage(
@@ -540,6 +2594,7 @@ def api_emails_save_draft():
         )
         db.session.add(m)
         db.session.commit()
+        versions.bump("emails")
         return jsonify({"id": m.id}), 201
 
 @app.route("/api/emails/send", methods=["POST"])
@@ -557,6 +2612,7 @@ def api_emails_send():
         m.read = True
         m.date_str = date_str
         db.session.commit()
+        versions.bump("emails")
         return jsonify({"id": m.id})
     else:
         m = EmailMessage(
@@ -571,6 +2627,7 @@ def api_emails_send():
         )
         db.session.add(m)
         db.session.commit()
+        versions.bump("emails")
         return jsonify({"id": m.id}), 201
 
 @app.route("/api/emails/<int:eid>", methods=["PATCH"])
@@ -582,6 +2639,7 @@ def api_emails_update(eid):
     if "folder" in data and data["folder"] in ("inbox","sent","draft"):
         m.folder = data["folder"]
     db.session.commit()
+    versions.bump("emails")
     return jsonify({"ok": True})
 
 @app.route("/api/emails/<int:eid>", methods=["DELETE"])
@@ -589,10 +2647,12 @@ def api_emails_delete(eid):
     m = EmailMessage.query.get_or_404(eid)
     db.session.delete(m)
     db.session.commit()
+    versions.bump("emails")
     return jsonify({"ok": True})
 
 #Main
 if __name__ == "__main__":
     print("GROQ_API_KEY loaded:", bool(GROQ_API_KEY))
     print("DB URL:", app.config["SQLALCHEMY_DATABASE_URI"])
-    app.run(debug=True)
+    init_db()
+    create_app().run(debug=True)
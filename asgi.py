@@ -0,0 +1,201 @@
+# ASGI entry point, for serving many open video/event streams from one process:
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000 --timeout-graceful-shutdown 5
+#
+# /video_feed and /events are served natively as asyncio tasks. One thread
+# reads the shared FrameBroadcaster and one listens on the EventBus; both hand
+# over to the event loop, which fans out to every open stream, so a viewer
+# costs a coroutine instead of a worker thread. Every other route runs through
+# the WSGI adapter on its own thread pool and never queues behind the streams.
+# With APP_MODE=api the streams fall through to Flask, which answers 404.
+import asyncio
+import os
+import threading
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as emodash
+
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))   # concurrent non-stream requests
+
+flask_app = emodash.create_app()
+wsgi = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+
+# Latest-frame fan-out: a pump thread subscribes to the broadcaster while
+# anyone is watching; viewers await the next frame and skip any they were
+# too slow to send.
+class FrameHub:
+    def __init__(self, broadcaster):
+        self._broadcaster = broadcaster
+        self._loop = None
+        self._ready = None      # asyncio.Event, set and replaced on every frame
+        self._frame = None
+        self._seq = 0
+        self._viewers = 0
+        self._pumping = False
+
+    def _pump(self, stream):
+        try:
+            for jpg in stream:
+                self._loop.call_soon_threadsafe(self._publish, jpg)
+                if self._viewers == 0:
+                    break
+        except Exception as e:
+            print("ASGI frame pump failed:", e)
+        finally:
+            stream.close()
+            self._loop.call_soon_threadsafe(self._pump_stopped)
+
+    def _start(self):
+        self._pumping = True
+        threading.Thread(target=self._pump, args=(self._broadcaster.subscribe(),),
+                         name="asgi-frames", daemon=True).start()
+
+    def _pump_stopped(self):
+        self._pumping = False
+        if self._viewers:
+            self._start()
+
+    def _publish(self, jpg):
+        self._frame = jpg
+        self._seq += 1
+        ready, self._ready = self._ready, asyncio.Event()
+        ready.set()
+
+    # register a viewer; returns the sequence number to wait from
+    def join(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._ready = asyncio.Event()
+        self._viewers += 1
+        if not self._pumping:
+            self._start()
+        return self._seq
+
+    def leave(self):
+        self._viewers -= 1
+
+    async def next_frame(self, last):
+        while self._seq == last:
+            await self._ready.wait()
+        if self._seq - last > 1:
+            emodash.metrics.inc("frames_dropped_total", self._seq - last - 1)
+        return self._seq, self._frame
+
+# Event fan-out: one thread listens on the EventBus for the life of the
+# process and copies every event into each open stream's queue. A stream whose
+# queue overflows is closed; the browser reconnects with Last-Event-ID.
+class EventHub:
+    def __init__(self, bus):
+        self._bus = bus
+        self._loop = None
+        self._queues = set()
+
+    def _pump(self, start_id):
+        for ev in self._bus.listen(start_id, keepalive=3600):
+            if ev is not None:
+                self._loop.call_soon_threadsafe(self._dispatch, ev)
+
+    def _dispatch(self, ev):
+        for q in list(self._queues):
+            try:
+                q.put_nowait(ev)
+            except asyncio.QueueFull:
+                self._queues.discard(q)
+                q.overflowed = True
+
+    def subscribe(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            threading.Thread(target=self._pump, args=(self._bus.last_event_id(),),
+                             name="asgi-events", daemon=True).start()
+        q = asyncio.Queue(maxsize=emodash.EVENT_BACKLOG)
+        q.overflowed = False
+        self._queues.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self._queues.discard(q)
+
+frames = FrameHub(emodash.broadcaster)
+events = EventHub(emodash.event_bus)
+
+def _seq_of(event_id):
+    return int(event_id.rpartition("-")[2])
+
+async def _body(send, chunk):
+    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+async def video_feed(scope, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"multipart/x-mixed-replace; boundary=frame"),
+                            (b"cache-control", b"no-cache")]})
+    last = frames.join()
+    try:
+        while True:
+            last, jpg = await frames.next_frame(last)
+            await _body(send, b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpg + b"\r\n")
+    finally:
+        frames.leave()
+
+async def event_stream(scope, send):
+    headers = dict(scope["headers"])
+    last_event_id = (headers.get(b"last-event-id", b"").decode()
+                     or parse_qs(scope["query_string"].decode()).get("last_event_id", [""])[0])
+    q = events.subscribe()
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+        await _body(send, b"retry: 3000\n\n")
+        last = 0
+        for eid, kind, data in emodash.event_bus.replay(last_event_id):
+            await _body(send, f"id: {eid}\nevent: {kind}\ndata: {data}\n\n".encode())
+            last = _seq_of(eid)
+        while True:
+            try:
+                eid, kind, data = await asyncio.wait_for(q.get(), emodash.EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if q.overflowed:
+                    return
+                await _body(send, b": keepalive\n\n")
+                continue
+            if _seq_of(eid) <= last:
+                continue
+            await _body(send, f"id: {eid}\nevent: {kind}\ndata: {data}\n\n".encode())
+    finally:
+        events.unsubscribe(q)
+
+STREAMS = {"/video_feed": video_feed, "/events": event_stream}
+
+# run a stream until it ends or the client goes away, whichever is first
+async def _serve_stream(handler, scope, receive, send):
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    stream = asyncio.ensure_future(handler(scope, send))
+    watcher = asyncio.ensure_future(disconnected())
+    await asyncio.wait({stream, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    for task in (stream, watcher):
+        task.cancel()
+    if stream.done() and not stream.cancelled() and stream.exception() is None:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    handler = STREAMS.get(scope.get("path")) if scope["type"] == "http" else None
+    if handler and scope["method"] == "GET" and emodash.serves_video():
+        return await _serve_stream(handler, scope, receive, send)
+    return await wsgi(scope, receive, send)
@@ -0,0 +1,340 @@
+# Offline replay benchmark for the vision pipeline.
+#
+# Feeds a recorded video (or synthetic frames) through the same stages the
+# webcam stream uses - face localization, crop, emotion inference, JPEG
+# encode, the Groq call and the write-behind persist - against a throwaway
+# SQLite database and a local stand-in for the Groq API with configurable
+# latency and error rate, so runs are repeatable without a camera or network.
+#
+#   python bench.py --video clip.mp4 --frames 600
+#   python bench.py --synthetic --face face.jpg --groq-latency-ms 800 --groq-error-rate 0.2
+#   python bench.py --video clip.mp4 --compare bench_results/before.json
+#
+# Prints FPS, per-stage p50/p95/p99, CPU and peak RSS, and writes the same
+# numbers as JSON (bench_results/ by default) so runs can be compared.
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+STAGES = ["read", "locate", "detect", "crop", "infer", "infer_batch", "encode", "frame", "groq", "groq_post", "persist"]
+GROQ_EMOTIONS = ["Calm", "Happy", "Focused", "Stressed", "Angry", "Sad", "Tired", "Anxious"]
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Replay frames through the vision pipeline and report stage latencies.")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--video", help="video file to replay")
+    src.add_argument("--synthetic", action="store_true", help="generate frames instead of reading a video")
+    p.add_argument("--face", help="face image pasted into synthetic frames (without one the cascade finds nothing)")
+    p.add_argument("--size", default="640x480", help="synthetic frame size WxH (default 640x480)")
+    p.add_argument("--frames", type=int, default=300, help="frames to process (default 300)")
+    p.add_argument("--loop", action="store_true", help="rewind the video until --frames is reached")
+    p.add_argument("--fps", type=float, default=0, help="pace input like a camera at this rate (default: as fast as possible)")
+    p.add_argument("--warmup", type=int, default=10, help="frames processed before timing starts (default 10)")
+    p.add_argument("--groq-latency-ms", type=float, default=400, help="stand-in Groq response time (default 400)")
+    p.add_argument("--groq-jitter-ms", type=float, default=100, help="stand-in latency std deviation (default 100)")
+    p.add_argument("--groq-error-rate", type=float, default=0.0, help="fraction of Groq calls answered 429/5xx (default 0)")
+    p.add_argument("--groq-interval", type=float, default=1.0, help="seconds between Groq calls (app default is 10)")
+    p.add_argument("--workers", type=int, help="EMOTION_WORKERS for this run")
+    p.add_argument("--groq-cache-size", type=int, help="GROQ_CACHE_SIZE for this run (0 disables the cache)")
+    p.add_argument("--seed", type=int, default=1, help="random seed for synthetic frames and the stand-in")
+    p.add_argument("--out", help="result JSON path (default bench_results/bench-<timestamp>.json)")
+    p.add_argument("--compare", help="earlier result JSON to print deltas against")
+    return p.parse_args(argv)
+
+# Local Groq stand-in: answers chat completions with a random allowed emotion
+class GroqStandIn:
+    def __init__(self, latency_ms, jitter_ms, error_rate, seed):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/openai/v1/chat/completions"
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with standin._lock:
+                    standin.requests += 1
+                    delay = max(0.0, standin.rng.gauss(standin.latency_ms, standin.jitter_ms)) / 1000.0
+                    fail = standin.rng.random() < standin.error_rate
+                    emotion = standin.rng.choice(GROQ_EMOTIONS)
+                    if fail:
+                        standin.errors += 1
+                time.sleep(delay)
+                if fail:
+                    status, body = standin.rng.choice([429, 500, 503]), {"error": {"message": "injected failure"}}
+                else:
+                    content = json.dumps({"emotion": emotion, "activity": ""})
+                    status, body = 200, {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="groq-standin", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+
+def video_frames(path, loop):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        sys.exit(f"cannot open video: {path}")
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                if loop and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                    ok, frame = cap.read()
+                if not ok:
+                    return
+            yield frame
+    finally:
+        cap.release()
+
+# noisy background with the face image (if any) drifting slowly across it
+def synthetic_frames(size, face_path, seed):
+    w, h = (int(v) for v in size.lower().split("x"))
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    face = None
+    if face_path:
+        face = cv2.imread(face_path)
+        if face is None:
+            sys.exit(f"cannot read face image: {face_path}")
+        scale = (h * 0.45) / face.shape[0]
+        face = cv2.resize(face, (max(1, int(face.shape[1] * scale)), max(1, int(face.shape[0] * scale))))
+        face = face[:h, :w]
+    i = 0
+    while True:
+        frame = background.copy()
+        noise = rng.integers(-6, 7, frame.shape, dtype=np.int16)
+        frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        if face is not None:
+            fh, fw = face.shape[:2]
+            span = max(1, w - fw)
+            x = int((np.sin(i / 40.0) + 1) / 2 * span)
+            y = max(0, (h - fh) // 2 + int(6 * np.sin(i / 13.0)))
+            y = min(y, h - fh)
+            frame[y:y+fh, x:x+fw] = face
+        i += 1
+        yield frame
+
+def rss_bytes():
+    if psutil:
+        proc = psutil.Process()
+        return proc.memory_info().rss + sum(c.memory_info().rss for c in proc.children(recursive=True))
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+def peak_rss_bytes():
+    if resource is None:
+        return rss_bytes()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def cpu_seconds():
+    own = time.process_time()
+    if psutil:
+        for c in psutil.Process().children(recursive=True):
+            try:
+                t = c.cpu_times()
+                own += t.user + t.system
+            except psutil.Error:
+                pass
+    return own
+
+def summarize(samples):
+    out = {}
+    for stage in STAGES + sorted(set(samples) - set(STAGES)):
+        vals = samples.get(stage)
+        if not vals:
+            continue
+        ms = np.asarray(vals) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        out[stage] = {"count": len(vals), "mean_ms": round(float(ms.mean()), 3),
+                      "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+                      "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+    return out
+
+def print_report(result, baseline=None):
+    print(f"\nframes {result['frames']}  faces {result['faces']}  wall {result['wall_s']:.2f}s  "
+          f"fps {result['fps']:.1f}  cpu {result['cpu_s']:.2f}s ({result['cpu_util']:.0%})  "
+          f"peak rss {result['rss_peak_mb']:.0f} MB")
+    g = result["groq"]
+    print(f"groq stand-in: {g['requests']} requests, {g['errors']} injected errors, "
+          f"cache {g.get('cache_hits', 0)} hits / {g.get('cache_misses', 0)} misses; "
+          f"rows written: {result['rows']}")
+    base = (baseline or {}).get("stages", {})
+    print(f"\n{'stage':<10}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" + ("   p95 vs base" if base else ""))
+    for stage, s in result["stages"].items():
+        line = f"{stage:<10}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+        if stage in base and base[stage]["p95_ms"]:
+            line += f"   {100.0 * (s['p95_ms'] / base[stage]['p95_ms'] - 1):+.1f}%"
+        print(line)
+    if baseline:
+        print(f"\nfps {baseline['fps']:.1f} -> {result['fps']:.1f} "
+              f"({100.0 * (result['fps'] / baseline['fps'] - 1) if baseline['fps'] else 0:+.1f}%), "
+              f"peak rss {baseline['rss_peak_mb']:.0f} -> {result['rss_peak_mb']:.0f} MB")
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    # throwaway database and config, set before app.py reads its environment
+    workdir = tempfile.mkdtemp(prefix="emodash-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["VERSIONS_DIR"] = os.path.join(workdir, "versions")
+    os.environ["GROQ_API_KEY"] = "bench"
+    if args.workers is not None:
+        os.environ["EMOTION_WORKERS"] = str(args.workers)
+    if args.groq_cache_size is not None:
+        os.environ["GROQ_CACHE_SIZE"] = str(args.groq_cache_size)
+
+    standin = GroqStandIn(args.groq_latency_ms, args.groq_jitter_ms, args.groq_error_rate, args.seed)
+    standin.start()
+
+    import app
+    app.init_db()
+    app.GROQ_URL = standin.url
+    app.GROQ_API_KEY = "bench"
+    app.GROQ_INTERVAL_SECONDS = args.groq_interval
+
+    samples = {}
+    lock = threading.Lock()
+    recording = threading.Event()
+
+    def record(stage, seconds):
+        if recording.is_set():
+            with lock:
+                samples.setdefault(stage, []).append(seconds)
+
+    app.stage_observers.append(record)
+
+    source = video_frames(args.video, args.loop) if args.video else synthetic_frames(args.size, args.face, args.seed)
+    pipeline = app.VisionPipeline()
+    period = 1.0 / args.fps if args.fps > 0 else 0
+
+    frames = faces_before = 0
+    wall0 = cpu0 = None
+    next_due = time.perf_counter()
+    for i in range(args.warmup + args.frames):
+        if i == args.warmup:
+            recording.set()
+            faces_before = pipeline.faces
+            wall0, cpu0 = time.perf_counter(), cpu_seconds()
+        if period:
+            delay = next_due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_due += period
+        t0 = time.perf_counter()
+        frame = next(source, None)
+        if frame is None:
+            break
+        t1 = time.perf_counter()
+        pipeline.encode(pipeline.process(frame))
+        record("read", t1 - t0)
+        record("frame", time.perf_counter() - t1)
+        if recording.is_set():
+            frames += 1
+    if wall0 is None:
+        sys.exit("input ended during warmup; lower --warmup or pass --loop")
+    wall = time.perf_counter() - wall0
+    cpu = cpu_seconds() - cpu0
+
+    # let in-flight inference, Groq calls and buffered rows land
+    if pipeline._pending is not None:
+        try:
+            pipeline._pending[0].result(timeout=30)
+        except Exception:
+            pass
+        pipeline._collect()
+    app.groq_worker.drain()
+    app.write_behind.flush()
+    recording.clear()
+
+    with app.app.app_context():
+        rows = {"mood_log": app.MoodLog.query.count(), "groq_label": app.GroqLabel.query.count(),
+                "suggestion": app.Suggestion.query.count()}
+    standin.stop()
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "env": {"python": platform.python_version(), "opencv": cv2.__version__,
+                "machine": platform.machine(), "cpus": os.cpu_count(),
+                "emotion_workers": app.emotion_service.workers},
+        "frames": frames,
+        "faces": pipeline.faces - faces_before,
+        "wall_s": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall else 0.0,
+        "cpu_s": round(cpu, 3),
+        "cpu_util": round(cpu / wall, 3) if wall else 0.0,
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+        "rss_peak_mb": round(peak_rss_bytes() / 2**20, 1),
+        "groq": {"requests": standin.requests, "errors": standin.errors,
+                 "cache_hits": app.groq_cache.hits, "cache_misses": app.groq_cache.misses,
+                 "cache_stale": app.groq_cache.stale},
+        "rows": rows,
+        "stages": summarize(samples),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    out = args.out or os.path.join("bench_results", datetime.now().strftime("bench-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nresults written to {out}")
+
+if __name__ == "__main__":
+    main()
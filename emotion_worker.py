@@ -0,0 +1,40 @@
+# Worker-side emotion model for the inference process pool.
+# Kept separate from app.py so the functions the pool pickles carry no Flask,
+# camera or database state. When the app is started with `python app.py`,
+# the spawn start method still re-imports that script in every worker (as
+# __mp_main__): the Flask app, SQLAlchemy engine and metrics are built there
+# too (~50 MB per worker), but nothing is started - no camera, no threads,
+# no database connection.
+import cv2
+import numpy as np
+
+# output order of DeepFace's facial-expression model
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+_model = None
+
+# pool initializer: load the emotion model once per worker process
+def init_worker():
+    global _model
+    from deepface import DeepFace
+    _model = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+
+# BGR face crop -> normalized 48x48 grayscale, as DeepFace feeds the model
+def _prepare(face_img):
+    img = face_img.astype(np.float32)
+    if img.max() > 1:
+        img /= 255.0
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (48, 48))
+
+# one forward pass for the whole batch; returns per-crop scores in percent
+def infer_batch(crops):
+    if _model is None:
+        init_worker()
+    batch = np.stack([_prepare(c) for c in crops])[..., np.newaxis]
+    preds = _model.model.predict(batch, verbose=0)
+    out = []
+    for p in preds:
+        total = float(p.sum()) or 1.0
+        out.append({label: 100.0 * float(v) / total for label, v in zip(EMOTION_LABELS, p)})
+    return out
@@ -0,0 +1,120 @@
+# Streaming parsers for the bulk import commands (flask import-mail / import-moods).
+# Each yields one record at a time so memory stays flat however large the input;
+# the app does the chunked, de-duplicated inserts.
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from email.utils import parsedate_to_datetime
+
+_parser = BytesParser(policy=default_policy)
+
+# mbox: messages start at a "From " line at file start or after a blank line
+def iter_mbox(path):
+    with open(path, "rb") as f:
+        buf, prev_blank = [], True
+        for line in f:
+            if line.startswith(b"From ") and prev_blank and buf:
+                yield b"".join(buf)
+                buf = []
+            buf.append(line)
+            prev_blank = line in (b"\n", b"\r\n")
+        if buf:
+            yield b"".join(buf)
+
+# Maildir: one message per file under cur/ and new/
+def iter_maildir(path):
+    for sub in ("cur", "new"):
+        d = os.path.join(path, sub)
+        if not os.path.isdir(d):
+            continue
+        with os.scandir(d) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    with open(entry.path, "rb") as f:
+                        yield f.read()
+
+def _text_body(msg):
+    part = msg.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        body = part.get_content()
+    except Exception:
+        body = part.get_payload(decode=True) or b""
+        body = body.decode("utf-8", "replace")
+    if part.get_content_type() == "text/html":
+        body = re.sub(r"<[^>]+>", " ", body)
+    return body.strip()
+
+# raw RFC 822 bytes -> EmailMessage column dict (message_id falls back to a content hash)
+def parse_email(raw, folder="inbox"):
+    msg = _parser.parsebytes(raw)
+    message_id = (msg.get("Message-ID") or "").strip()
+    if not message_id:
+        message_id = "<sha1:" + hashlib.sha1(raw).hexdigest() + ">"
+    try:
+        sent = parsedate_to_datetime(msg.get("Date"))
+        if sent.tzinfo is None:
+            sent = sent.replace(tzinfo=timezone.utc)
+    except Exception:
+        sent = datetime.now(timezone.utc)
+    return dict(
+        message_id=message_id[:255],
+        sender=str(msg.get("From") or "(unknown sender)")[:255],
+        to=str(msg.get("To") or "")[:255] or None,
+        subject=str(msg.get("Subject") or "(no subject)")[:255],
+        content=_text_body(msg),
+        folder=folder,
+        starred=False,
+        read=True,
+        date_str=sent.strftime("%a, %d %b %Y, %I:%M %p"),
+        ts_utc=sent.astimezone(timezone.utc).replace(tzinfo=None),
+    )
+
+# JSON array (like mood_log.json) or NDJSON, decoded incrementally object by object
+def iter_json_records(path, bufsize=1 << 16):
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = f.read(bufsize).lstrip()
+        if buf.startswith("["):
+            buf = buf[1:]
+        while True:
+            buf = buf.lstrip().lstrip(",").lstrip()
+            if buf.startswith("]"):
+                return
+            if not buf:
+                more = f.read(bufsize)
+                if not more:
+                    return
+                buf = more
+                continue
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                more = f.read(bufsize)
+                if not more:
+                    raise
+                buf += more
+                continue
+            buf = buf[end:]
+            if isinstance(obj, dict):
+                yield obj
+
+# mood JSON record -> MoodLog column dict
+def parse_mood(rec):
+    ts = datetime.fromisoformat(rec["ts"])
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    return dict(
+        ts_utc=ts.replace(tzinfo=None),
+        ts_iso=ts.isoformat(),
+        emotion=str(rec.get("emotion") or "Unknown")[:32],
+        note=str(rec.get("note") or "")[:255],
+        source=str(rec.get("source") or "import")[:16],
+        samples=int(rec.get("samples") or 1),
+    )
@@ -0,0 +1,82 @@
+# Lexicon-based urgency and sentiment scores for email, used to rank the inbox
+# by mood. Scoring is batched: every message's lexicon hits go into one count
+# matrix that is multiplied by the term weights, so a whole import chunk or
+# backfill page is scored in a single pass. No Flask here; the app stores the
+# results in EmailMessage.urgency / .sentiment.
+import re
+
+import numpy as np
+
+# term or two-word phrase -> (urgency weight, sentiment weight)
+LEXICON = {
+    # urgency
+    "urgent": (2.0, -0.3), "urgently": (2.0, -0.3), "asap": (2.0, -0.2),
+    "immediately": (2.0, -0.2), "immediate": (1.5, 0.0), "emergency": (2.5, -1.0),
+    "critical": (2.0, -0.5), "deadline": (1.5, 0.0), "due": (1.0, 0.0),
+    "overdue": (2.0, -1.0), "past due": (2.0, -0.5), "reminder": (1.0, 0.0),
+    "final notice": (2.5, -1.0), "last chance": (1.5, 0.0), "action required": (2.5, -0.3),
+    "response required": (2.0, 0.0), "time sensitive": (2.0, 0.0), "right away": (1.5, 0.0),
+    "important": (1.0, 0.0), "priority": (1.0, 0.0), "escalate": (1.5, -0.5),
+    "escalation": (1.5, -0.5), "outage": (2.0, -1.0), "expires": (1.2, 0.0),
+    "expiring": (1.2, 0.0), "expired": (1.0, -0.5), "today": (0.8, 0.0),
+    "tonight": (0.8, 0.0), "tomorrow": (0.5, 0.0), "eod": (1.5, 0.0),
+    "end of": (0.3, 0.0), "hurry": (1.5, 0.0), "quickly": (0.8, 0.0),
+    "warning": (1.2, -1.0), "alert": (1.2, -0.5), "suspended": (1.5, -1.5),
+    "required": (0.8, 0.0), "must": (0.6, 0.0),
+    # sentiment
+    "thanks": (0.0, 1.0), "thank": (0.0, 1.0), "great": (0.0, 1.0),
+    "pleased": (0.0, 1.2), "happy": (0.0, 1.0), "welcome": (0.0, 1.0),
+    "congratulations": (0.0, 2.0), "congrats": (0.0, 2.0), "excellent": (0.0, 1.5),
+    "appreciate": (0.0, 1.2), "glad": (0.0, 1.0), "enjoy": (0.0, 1.0),
+    "invite": (0.0, 0.6), "invited": (0.0, 0.6), "invitation": (0.0, 0.6),
+    "success": (0.0, 1.2), "successful": (0.0, 1.2), "love": (0.0, 1.5),
+    "wonderful": (0.0, 1.5), "good": (0.0, 0.6), "ready": (0.0, 0.5),
+    "approved": (0.0, 1.2), "see you": (0.0, 0.5), "best regards": (0.0, 0.3),
+    "unfortunately": (0.0, -1.5), "sorry": (0.0, -0.8), "problem": (0.0, -1.0),
+    "issue": (0.0, -0.8), "issues": (0.0, -0.8), "failed": (0.5, -1.5),
+    "failure": (0.5, -1.5), "error": (0.3, -1.0), "complaint": (0.5, -1.5),
+    "disappointed": (0.0, -1.8), "angry": (0.0, -2.0), "upset": (0.0, -1.5),
+    "cancel": (0.3, -1.0), "cancelled": (0.3, -1.2), "canceled": (0.3, -1.2),
+    "rejected": (0.3, -1.8), "denied": (0.3, -1.5), "penalty": (1.0, -1.5),
+    "terminated": (1.0, -2.0), "late": (0.5, -0.8), "missed": (0.5, -1.0),
+    "bad": (0.0, -1.0), "worst": (0.0, -2.0), "concern": (0.0, -0.8),
+    "concerns": (0.0, -0.8), "not happy": (0.0, -2.0), "not good": (0.0, -1.6),
+}
+
+SUBJECT_WEIGHT = 2.0     # a hit in the subject counts double
+EXCLAMATION_URGENCY = 0.3
+URGENCY_SCALE = 3.0      # raw urgency at which the score reaches ~0.63
+SENTIMENT_SCALE = 3.0
+
+_TERMS = list(LEXICON)
+_INDEX = {t: i for i, t in enumerate(_TERMS)}
+_WEIGHTS = np.array([LEXICON[t] for t in _TERMS], dtype=np.float64)   # (terms, 2)
+_WORD = re.compile(r"[a-z0-9']+")
+
+def _hits(text, weight, row, rows, cols, vals):
+    words = _WORD.findall((text or "").lower())
+    for tok in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        j = _INDEX.get(tok)
+        if j is not None:
+            rows.append(row)
+            cols.append(j)
+            vals.append(weight)
+
+# (subjects, bodies) -> (urgency in [0, 1], sentiment in [-1, 1]) per message
+def score_batch(subjects, bodies):
+    n = len(subjects)
+    if n == 0:
+        return [], []
+    rows, cols, vals = [], [], []
+    bangs = np.zeros(n, dtype=np.float64)
+    for i, (subject, body) in enumerate(zip(subjects, bodies)):
+        _hits(subject, SUBJECT_WEIGHT, i, rows, cols, vals)
+        _hits(body, 1.0, i, rows, cols, vals)
+        bangs[i] = min((subject or "").count("!") + (body or "").count("!"), 5)
+    counts = np.zeros((n, len(_TERMS)), dtype=np.float64)
+    np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+              np.asarray(vals, dtype=np.float64))
+    raw = counts @ _WEIGHTS
+    urgency = 1.0 - np.exp(-(raw[:, 0] + EXCLAMATION_URGENCY * bangs) / URGENCY_SCALE)
+    sentiment = np.tanh(raw[:, 1] / SENTIMENT_SCALE)
+    return np.round(urgency, 3).tolist(), np.round(sentiment, 3).tolist()